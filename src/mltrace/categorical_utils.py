@@ -0,0 +1,101 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Helpers to keep the low-cardinality log columns dictionary-encoded."""
+
+import functools
+from typing import Iterable
+
+from mltrace import constants
+import pandas as pd
+
+
+def to_categoricals(
+    logs: pd.DataFrame, columns: Iterable[str] = constants.CATEGORICAL_COLUMNS
+) -> pd.DataFrame:
+  """Converts the given columns of the logs to categoricals.
+
+  Columns that are missing or already categorical are left as they are.
+
+  Args:
+      logs (pd.DataFrame): Workload logs
+      columns (Iterable[str]): Columns to convert
+
+  Returns:
+      pd.DataFrame: Logs with categorical columns
+  """
+  converted = {
+      column: logs[column].astype("category")
+      for column in columns
+      if column in logs.columns
+      and not isinstance(logs[column].dtype, pd.CategoricalDtype)
+  }
+  if not converted:
+    return logs
+  return logs.assign(**converted)
+
+
+def set_where(series: pd.Series, mask: pd.Series, value) -> pd.Series:
+  """Sets `value` where `mask` is true, adding it to the categories if needed.
+
+  Args:
+      series (pd.Series): Categorical or plain column
+      mask (pd.Series): Rows to set
+      value: Value to set
+
+  Returns:
+      pd.Series: Updated column
+  """
+  if (
+      isinstance(series.dtype, pd.CategoricalDtype)
+      and value not in series.cat.categories
+  ):
+    series = series.cat.add_categories([value])
+  return series.mask(mask, value)
+
+
+def concat_logs(frames: list[pd.DataFrame]) -> pd.DataFrame:
+  """Concatenates logs, keeping the categorical columns categorical.
+
+  `pd.concat` falls back to object columns when the categories differ between
+  the frames, so the categories of each column are unified first.
+
+  Args:
+      frames (list[pd.DataFrame]): Logs to concatenate
+
+  Returns:
+      pd.DataFrame: Concatenated logs with a fresh index
+  """
+  categorical_columns = set()
+  for logs in frames:
+    categorical_columns.update(
+        column
+        for column, dtype in logs.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    )
+  frames = list(frames)
+  for column in categorical_columns:
+    columns = [logs[column] for logs in frames if column in logs.columns]
+    if not all(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+      continue
+    categories = functools.reduce(
+        lambda a, b: a.union(b, sort=False),
+        (c.cat.categories for c in columns),
+    )
+    frames = [
+        logs.assign(**{column: logs[column].cat.set_categories(categories)})
+        if column in logs.columns
+        else logs
+        for logs in frames
+    ]
+  return pd.concat(frames, ignore_index=True)
@@ -17,6 +17,55 @@
 
 TIME_REGEXP = "%Y-%m-%dT%H:%M:%S.%f%z"
 WORKER_GROUP_PREFIX = "Slice-Worker "
+COORDINATOR_GROUP = "Coordinator"
+# Parent group of the logs that were folded across McJAX workers.
+ALL_WORKERS_GROUP = "All workers"
+
+# Columns read by the log parser and the trace translator. Columnar inputs are
+# projected down to these. Dotted names refer to nested fields, which are read
+# as flat columns.
+LOG_COLUMNS = [
+    "timestamp",
+    "severity",
+    "textPayload",
+    "jsonPayload.message",
+    "resource.labels.pod_name",
+    "resource.labels.container_name",
+    "sourceLocation.file",
+]
+
+# Low-cardinality columns that are stored as pandas categoricals. They hold a
+# few hundred distinct values across millions of logs.
+CATEGORICAL_COLUMNS = [
+    "parent",
+    "section",
+    "severity",
+    "resource.labels.pod_name",
+    "resource.labels.container_name",
+    "sourceLocation.file",
+    "cluster_name",
+    "location",
+]
+
+# Engines of the log parser's filter and section stages. "pyarrow" runs them
+# with Arrow compute kernels on Arrow string arrays.
+PARSER_ENGINES = ["python", "pyarrow"]
+
+# Columnar file formats supported by the file log reader.
+COLUMNAR_FILE_FORMATS = {
+    ".parquet": "parquet",
+    ".arrow": "ipc",
+    ".ipc": "ipc",
+    ".feather": "feather",
+}
+
+# Compression suffixes of text log files, mapped to the pandas compression
+# names. The files are decompressed while they are read.
+COMPRESSED_FILE_SUFFIXES = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".zst": "zstd",
+}
 
 REGEX_SUBSTR_MATCH_ROW_HEADERS = {
     "[E] Some workers didn't report an error after ": "Node pool error",
@@ -14,15 +14,57 @@
 
 """Parser for the logs that filters, groups and enriches the logs."""
 
+import concurrent.futures
 import logging
-import warnings
+import os
+from typing import Optional
 
+from mltrace import categorical_utils
 from mltrace import constants
+from mltrace import matcher
+from mltrace import rules
+from mltrace import topology
 import numpy as np
 import pandas as pd
 
+try:
+  import pyarrow as pa
+  from pyarrow import compute as pa_compute
+except ImportError:
+  pa = None
+  pa_compute = None
+
 logger = logging.getLogger(__name__)
 
+# Columns read by the filter and section stages.
+FILTER_COLUMNS = ["textPayload", "sourceLocation.file", "severity"]
+# Partitions smaller than this are not worth shipping to a worker process.
+MIN_PARTITION_SIZE = 50_000
+# Partitions per worker process, so that a slow partition doesn't hold up
+# the others for long.
+PARTITIONS_PER_WORKER = 4
+
+# Rules and engine of the filter and section stages in a worker process, set
+# once by `_init_worker`.
+_worker_rule_set = None
+_worker_engine = None
+
+# Nested fields of the JSON exports that are extracted into flat columns:
+# nested column -> {flat column: (path in the nested column, value used when
+# the nested column is missing)}.
+NESTED_FIELDS = {
+    "resource": {
+        "resource.labels.pod_name": (["labels", "pod_name"], None),
+        "resource.labels.container_name": (["labels", "container_name"], None),
+    },
+    "jsonPayload": {
+        "jsonPayload.message": (["message"], ""),
+    },
+    "sourceLocation": {
+        "sourceLocation.file": (["file"], ""),
+    },
+}
+
 
 def parse_mcjax(logs: pd.DataFrame, jobname: str) -> pd.DataFrame:
   """Parses, groups and enriches MCJAX workload logs.
@@ -34,68 +76,198 @@ def parse_mcjax(logs: pd.DataFrame, jobname: str) -> pd.DataFrame:
   Returns:
       pd.DataFrame: Enriched logs
   """
-  logs["worker_num"] = logs["resource.labels.pod_name"].str.extract(
-      rf"{jobname}-.*?-(\d*?-\d*?)-"
-  )
-  logs["parent"] = constants.WORKER_GROUP_PREFIX + logs["worker_num"]
+  return topology.TopologyResolver(jobname, is_mcjax=True).resolve(logs)
 
-  # slice#0 worker#0 is the Coordinator.
-  logs.loc[
-      logs["parent"] == constants.WORKER_GROUP_PREFIX + "0-0", "parent"
-  ] = "Coordinator"
 
-  return logs
+def check_engine(engine: str):
+  """Checks that the parser engine is supported and can be used.
+
+  Args:
+      engine (str): One of `constants.PARSER_ENGINES`
+
+  Raises:
+      ValueError: If the engine is unknown
+      ImportError: If the engine's dependencies are not installed
+  """
+  if engine not in constants.PARSER_ENGINES:
+    raise ValueError(
+        f"Invalid engine {engine!r}. Supported: {constants.PARSER_ENGINES}"
+    )
+  if engine == "pyarrow" and pa is None:
+    raise ImportError(
+        "The pyarrow engine requires pyarrow. Install it with"
+        " `pip install pyarrow`."
+    )
+
+
+def _uses_arrow(texts: pd.Series, engine: str) -> bool:
+  """Returns whether to match the rules on the texts with Arrow kernels.
+
+  Texts that are already stored in Arrow, e.g. pandas' default "str" dtype,
+  are matched with Arrow kernels with either engine: the Python matchers would
+  have to convert every text to a Python string first.
+  """
+  return engine == "pyarrow" or matcher.is_arrow_backed(texts)
 
 
-def add_section(logs: pd.DataFrame) -> pd.DataFrame:
+def add_section(
+    logs: pd.DataFrame,
+    rule_set: Optional[rules.RuleSet] = None,
+    engine: str = "python",
+) -> pd.DataFrame:
   """Sub-group the logs.
 
   Args:
       logs (pd.DataFrame): Workload logs
+      rule_set (rules.RuleSet): Rules of the sections. Defaults to the
+        built-in rules.
+      engine (str): "python", or "pyarrow" to match the rules with Arrow
+        compute kernels. Arrow-backed texts always are.
 
   Returns:
       pd.DataFrame: Logs with a new "section" column
   """
-  logs = logs.assign(section=logs["sourceLocation.file"])
-  logs.loc[(logs["section"].isna()) | (logs["section"] == ""), "section"] = (
-      "Other logs"
+  files = logs["sourceLocation.file"]
+  default_sections = categorical_utils.set_where(
+      files, files.isna() | (files == ""), "Other logs"
+  )
+  rule_set = rule_set or rules.get_default_rule_set()
+  if _uses_arrow(logs["textPayload"], engine):
+    classifier = rule_set.arrow_section_classifier
+  else:
+    classifier = rule_set.section_classifier
+  # The last matching rule wins, falling back to the source file.
+  sections = classifier.classify_all(logs["textPayload"])
+  return logs.assign(
+      section=sections.where(sections.notna(), default_sections)
   )
-  for k in constants.REGEX_SUBSTR_MATCH_ROW_HEADERS:
-    logs.loc[
-        logs["textPayload"].str.contains(k, case=False, regex=True, na=False),
-        "section",
-    ] = constants.REGEX_SUBSTR_MATCH_ROW_HEADERS[k]
 
-  return logs
+
+def _extract_nested_fields_with_arrow(
+    nested: pd.Series, fields: dict[str, tuple[list[str], object]]
+) -> dict[str, np.ndarray]:
+  """Extracts the fields from a column of dicts, converted once to Arrow."""
+  structs = pa.array(nested, from_pandas=True)
+  if not pa.types.is_struct(structs.type):
+    raise TypeError(f"Expected a struct column, got {structs.type}")
+  is_missing = structs.is_null().to_numpy(zero_copy_only=False)
+  values = {}
+  for flat_column, (path, default) in fields.items():
+    field_type = structs.type
+    for key in path:
+      if (
+          not pa.types.is_struct(field_type)
+          or field_type.get_field_index(key) < 0
+      ):
+        field_type = None
+        break
+      field_type = field_type.field(key).type
+    if field_type is None:
+      column = np.full(len(nested), None, dtype=object)
+    else:
+      column = pa_compute.struct_field(structs, path).to_numpy(
+          zero_copy_only=False
+      ).astype(object)
+    column[is_missing] = default
+    values[flat_column] = column
+  return values
 
 
-def filter_out_unnecessary_logs(logs: pd.DataFrame) -> pd.DataFrame:
+def _extract_nested_fields_with_python(
+    nested: pd.Series, fields: dict[str, tuple[list[str], object]]
+) -> dict[str, np.ndarray]:
+  """Extracts the fields from a column of dicts in a single Python pass."""
+  values = {flat_column: [] for flat_column in fields}
+  for d in nested:
+    for flat_column, (path, default) in fields.items():
+      if not isinstance(d, dict):
+        values[flat_column].append(default)
+        continue
+      value = d
+      for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+      values[flat_column].append(value)
+  return {k: np.array(v, dtype=object) for k, v in values.items()}
+
+
+def flatten_nested_fields(logs: pd.DataFrame) -> pd.DataFrame:
+  """Extracts the nested fields used by the parser into flat columns.
+
+  Each nested column is converted to an Arrow struct array once, and all of
+  its fields are then extracted as whole columns. Without pyarrow, or if the
+  nested values don't fit a single struct type, the fields of each nested
+  column are extracted in one pass over its values.
+
+  If a nested column is missing, e.g. in a chunk of a JSONL file without any
+  `jsonPayload`, its flat columns are filled with their defaults so that every
+  chunk has the same columns.
+
+  Args:
+      logs (pd.DataFrame): Workload logs
+
+  Returns:
+      pd.DataFrame: Logs with the flat columns of the nested fields
+  """
+  flat_columns = {}
+  for nested_column, fields in NESTED_FIELDS.items():
+    if nested_column not in logs.columns:
+      flat_columns.update({
+          flat_column: pd.Series(default, index=logs.index, dtype=object)
+          for flat_column, (_, default) in fields.items()
+          if flat_column not in logs.columns
+      })
+      continue
+    nested = logs[nested_column]
+    values = None
+    if pa is not None:
+      try:
+        values = _extract_nested_fields_with_arrow(nested, fields)
+      except (TypeError, pa.ArrowException) as e:
+        logger.debug("Falling back to Python for %s: %s", nested_column, e)
+    if values is None:
+      values = _extract_nested_fields_with_python(nested, fields)
+    flat_columns.update(
+        {k: pd.Series(v, index=logs.index) for k, v in values.items()}
+    )
+    logger.debug("Extracted %s from the logs.", list(fields))
+  if not flat_columns:
+    return logs
+  return logs.assign(**flat_columns)
+
+
+def filter_out_unnecessary_logs(
+    logs: pd.DataFrame,
+    rule_set: Optional[rules.RuleSet] = None,
+    engine: str = "python",
+) -> pd.DataFrame:
   """Remove the logs that are usually not helpful in debugging.
 
   Args:
       logs (pd.DataFrame): Workload logs
+      rule_set (rules.RuleSet): Rules of the redundant logs. Defaults to the
+        built-in rules.
+      engine (str): "python", or "pyarrow" to match the rules with Arrow
+        compute kernels. Arrow-backed texts always are.
 
   Returns:
       pd.DataFrame: Filtered logs
   """
-  logs = logs[
-      ~logs["textPayload"].isin(
-          constants.REDUNDANT_LOGS_EXACT
-          + constants.FILE_ONLY_REDUNDANT_LOGS_EXACT
-      )
-  ]
-  r = "|".join(constants.REDUNDANT_LOGS_SUBSTR_MATCH)
-  with warnings.catch_warnings():
-    warnings.filterwarnings(
-        "ignore",
-        message=(
-            "This pattern is interpreted as a regular expression, and has match"
-            " groups.*"
-        ),
-        category=UserWarning,
+  rule_set = rule_set or rules.get_default_rule_set()
+  redundant_logs_exact = (
+      rule_set.redundant_logs_exact + rule_set.file_only_redundant_logs_exact
+  )
+  if _uses_arrow(logs["textPayload"], engine):
+    is_redundant = pa_compute.is_in(
+        matcher.to_arrow_strings(logs["textPayload"]),
+        value_set=pa.array(redundant_logs_exact, pa.string()),
     )
-    logs = logs[~logs["textPayload"].str.contains(r, regex=True)]
-  for filename, severity in constants.REDUNDANT_SEVERITY_IN_FILES.items():
+    logs = logs[~is_redundant.to_numpy(zero_copy_only=False)]
+    redundant_logs_matcher = rule_set.arrow_redundant_logs_matcher
+  else:
+    logs = logs[~logs["textPayload"].isin(redundant_logs_exact)]
+    redundant_logs_matcher = rule_set.redundant_logs_matcher
+  logs = logs[~redundant_logs_matcher.contains(logs["textPayload"])]
+  for filename, severity in rule_set.redundant_severity_in_files.items():
     logs = logs[
         ~(
             (logs["sourceLocation.file"] == filename)
@@ -106,58 +278,190 @@ def filter_out_unnecessary_logs(logs: pd.DataFrame) -> pd.DataFrame:
   return logs
 
 
-def parse_logs(logs: pd.DataFrame, jobname: str) -> pd.DataFrame:
+def _init_worker(rule_set: rules.RuleSet, engine: str):
+  global _worker_rule_set, _worker_engine
+  _worker_rule_set = rule_set
+  _worker_engine = engine
+
+
+def _to_ipc(logs: pd.DataFrame) -> bytes:
+  """Serializes the logs to the Arrow IPC stream format."""
+  table = pa.Table.from_pandas(logs, preserve_index=False)
+  sink = pa.BufferOutputStream()
+  with pa.ipc.new_stream(sink, table.schema) as writer:
+    writer.write_table(table)
+  return sink.getvalue().to_pybytes()
+
+
+def _filter_and_add_section_partition(
+    buffer: bytes,
+) -> tuple[np.ndarray, pd.Categorical]:
+  """Runs the filter and section stages on a partition in a worker process.
+
+  Args:
+      buffer (bytes): `FILTER_COLUMNS` of the partition in the Arrow IPC
+        stream format
+
+  Returns:
+      tuple[np.ndarray, pd.Categorical]: Whether each log is kept, and the
+      sections of the kept logs
+  """
+  logs = pa.ipc.open_stream(buffer).read_all().to_pandas()
+  kept_logs = filter_out_unnecessary_logs(
+      logs, _worker_rule_set, _worker_engine
+  )
+  keep = np.zeros(len(logs), dtype=bool)
+  keep[kept_logs.index.to_numpy()] = True
+  sections = add_section(kept_logs, _worker_rule_set, _worker_engine)
+  return keep, pd.Categorical(sections["section"])
+
+
+class PartitionedParser:
+  """Runs the filter and section stages over partitions in worker processes.
+
+  The logs are split into contiguous row ranges. Only the columns read by the
+  stages are shipped to the workers, as Arrow IPC buffers, and the workers
+  send back a keep mask and the sections of the kept logs, which are stitched
+  together in the original order. Use as a context manager, so that the pool
+  of worker processes is shut down.
+  """
+
+  def __init__(
+      self,
+      rule_set: Optional[rules.RuleSet] = None,
+      engine: str = "python",
+      num_workers: Optional[int] = None,
+  ):
+    """Initializes the parser and starts the worker processes.
+
+    Args:
+        rule_set (rules.RuleSet): Rules of the redundant logs and the
+          sections. Defaults to the built-in rules.
+        engine (str): Engine of the filter and section stages
+        num_workers (int): Number of worker processes. Defaults to the number
+          of CPUs.
+    """
+    if pa is None:
+      raise ImportError(
+          "Parsing in parallel requires pyarrow. Install it with"
+          " `pip install pyarrow`."
+      )
+    check_engine(engine)
+    self._rule_set = rule_set or rules.get_default_rule_set()
+    self._engine = engine
+    self._executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(self._rule_set, engine),
+    )
+    self._num_workers = num_workers or os.cpu_count() or 1
+
+  def __enter__(self) -> "PartitionedParser":
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    """Shuts down the worker processes."""
+    self._executor.shutdown()
+
+  def filter_and_add_section(self, logs: pd.DataFrame) -> pd.DataFrame:
+    """Filters out the unnecessary logs and sub-groups the others.
+
+    Same as `add_section(filter_out_unnecessary_logs(logs))`, with the
+    partitions processed in parallel.
+
+    Args:
+        logs (pd.DataFrame): Workload logs
+
+    Returns:
+        pd.DataFrame: Filtered logs with a new "section" column
+    """
+    num_partitions = min(
+        self._num_workers * PARTITIONS_PER_WORKER,
+        len(logs) // MIN_PARTITION_SIZE,
+    )
+    if num_partitions <= 1:
+      return add_section(
+          filter_out_unnecessary_logs(logs, self._rule_set, self._engine),
+          self._rule_set,
+          self._engine,
+      )
+    logger.debug(
+        "Filtering %d logs in %d partitions.", len(logs), num_partitions
+    )
+    bounds = np.linspace(0, len(logs), num_partitions + 1, dtype=int)
+    buffers = (
+        _to_ipc(logs[FILTER_COLUMNS].iloc[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    )
+    keeps = []
+    sections = []
+    for keep, partition_sections in self._executor.map(
+        _filter_and_add_section_partition, buffers
+    ):
+      keeps.append(keep)
+      sections.append(pd.DataFrame({"section": partition_sections}))
+    logs = logs[np.concatenate(keeps)]
+    return logs.assign(
+        section=categorical_utils.concat_logs(sections)["section"].array
+    )
+
+
+def parse_logs(
+    logs: pd.DataFrame,
+    jobname: str,
+    topology_resolver: Optional[topology.TopologyResolver] = None,
+    rule_set: Optional[rules.RuleSet] = None,
+    engine: str = "python",
+    partitioned_parser: Optional[PartitionedParser] = None,
+) -> pd.DataFrame:
   """Parses, groups and enriches the workload logs.
 
   Args:
       logs (pd.DataFrame): Workload logs
       jobname (str): Name of the workload
+      topology_resolver (topology.TopologyResolver): Resolver to reuse across
+        the chunks of the same workload. A new one is used by default.
+      rule_set (rules.RuleSet): Rules of the redundant logs and the sections.
+        Defaults to the built-in rules.
+      engine (str): "python", or "pyarrow" to run the filter and section
+        stages with Arrow compute kernels on Arrow-backed strings
+      partitioned_parser (PartitionedParser): Optional parser that runs the
+        filter and section stages in worker processes. It must have been
+        created with the same rule set and engine.
 
   Returns:
       pd.DataFrame: Enriched logs
   """
+  check_engine(engine)
   logger.debug("Starting the log parser for jobname: %s", jobname)
-  if "resource" in logs.columns:
-    logs["resource.labels.pod_name"] = logs["resource"].apply(
-        lambda x: x.get("labels").get("pod_name")
-    )
-    logs["resource.labels.container_name"] = logs["resource"].apply(
-        lambda x: x.get("labels").get("container_name")
-    )
-    logger.debug("Extracted resource labels from the logs.")
-  logs["parent"] = logs["resource.labels.pod_name"].str.extract(
-      rf"{jobname}-(.*?)-"
-  )
-  # todo: Use a better way to identify a McJAX vs Pathways workload.
-  if "slice" in logs["parent"].values or "job" in logs["parent"].values:
-    logger.info("McJAX workload detected.")
-    logs = parse_mcjax(logs, jobname)
-  else:
-    logger.info("Pathways workload detected.")
-    # Use the container name for defining the top-level section for Pathways.
-    logs["parent"] = logs["resource.labels.container_name"]
-    logs.loc[logs["parent"] == "", "parent"] = "Outside a container"
-
-  if "jsonPayload" in logs.columns:
-    logs["jsonPayload.message"] = logs["jsonPayload"].apply(
-        lambda x: x.get("message") if not pd.isnull(x) else ""
-    )
+  logs = categorical_utils.to_categoricals(flatten_nested_fields(logs))
+  if topology_resolver is None:
+    topology_resolver = topology.TopologyResolver(jobname)
+  logs = topology_resolver.resolve(logs)
+
+  if "textPayload" not in logs.columns:
+    # E.g. a chunk of a JSONL file whose logs all have a jsonPayload.
+    logs = logs.assign(textPayload=logs["jsonPayload.message"])
   logs.loc[logs["textPayload"] == "", "textPayload"] = logs[
       "jsonPayload.message"
   ]
   logs["textPayload"] = logs["textPayload"].fillna(logs["jsonPayload.message"])
   logs.loc[logs["textPayload"] == "", "textPayload"] = np.nan
   logs.dropna(subset=["textPayload"], inplace=True)
-
-  if "sourceLocation" in logs.columns:
-    logs["sourceLocation.file"] = logs["sourceLocation"].apply(
-        lambda x: x.get("file") if not pd.isnull(x) else ""
-    )
+  if engine == "pyarrow" and logs["textPayload"].dtype == object:
+    logs["textPayload"] = logs["textPayload"].astype("string[pyarrow]")
 
   logger.debug("Filtering out unnecessary logs.")
-  logs = filter_out_unnecessary_logs(logs)
-
-  logs = add_section(logs)
+  if partitioned_parser is not None:
+    logs = partitioned_parser.filter_and_add_section(logs)
+  else:
+    logs = add_section(
+        filter_out_unnecessary_logs(logs, rule_set, engine), rule_set, engine
+    )
+  logs = categorical_utils.to_categoricals(logs)
 
   logger.debug("Log parser completed.")
   return logs
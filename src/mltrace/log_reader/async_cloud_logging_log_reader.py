@@ -0,0 +1,152 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads logs from Cloud Logging with the asyncio client."""
+
+import asyncio
+import datetime
+import logging
+import queue
+import threading
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from google.cloud import logging_v2
+from . import cloud_logging_log_reader
+from .. import categorical_utils
+from .. import constants
+from .. import rules
+
+# Maximum number of fetched pages waiting to be parsed.
+QUEUE_SIZE = 4
+logger = logging.getLogger(__name__)
+
+
+class AsyncCloudLoggingLogReader(
+    cloud_logging_log_reader.CloudLoggingLogReader
+):
+  """Reads logs from Cloud Logging page by page with the asyncio client.
+
+  The pages are fetched on an event loop in a background thread and handed
+  over through a bounded queue. The caller parses page k while page k+1 is
+  still in flight, which hides the network latency behind the parsing.
+  """
+
+  def __init__(
+      self,
+      project_id: str,
+      jobname: str,
+      start: str,
+      end: str,
+      log_filter: str,
+      queue_size: int = QUEUE_SIZE,
+      rule_set: Optional[rules.RuleSet] = None,
+  ):
+    """Initializes the reader.
+
+    Args:
+        project_id (str): GCP project to read the logs from
+        jobname (str): Name of the job/jobset
+        start (str): Start of the time window
+        end (str): End of the time window
+        log_filter (str): Cloud Logging filter
+        queue_size (int): Maximum number of fetched pages waiting to be parsed
+        rule_set (rules.RuleSet): Rules of the redundant logs excluded by the
+          filter. Defaults to the built-in rules.
+    """
+    super().__init__(
+        project_id, jobname, start, end, log_filter, rule_set=rule_set
+    )
+    self._queue_size = queue_size
+
+  async def _fetch_pages(
+      self,
+      request: logging_v2.types.ListLogEntriesRequest,
+      pages: queue.Queue,
+  ):
+    """Puts the fetched pages into the queue, followed by None.
+
+    Errors are put into the queue, so that they are raised by the consumer.
+    """
+    try:
+      client = (
+          logging_v2.services.logging_service_v2.LoggingServiceV2AsyncClient()
+      )
+      pager = await client.list_log_entries(request=request)
+      async for page in pager.pages:
+        # Blocks while the queue is full, which bounds the pages in memory.
+        await asyncio.to_thread(pages.put, page)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+      await asyncio.to_thread(pages.put, e)
+    await asyncio.to_thread(pages.put, None)
+
+  def read_logs_in_chunks(
+      self, chunksize: Optional[int] = None
+  ) -> Iterator[pd.DataFrame]:
+    """Reads the logs as a sequence of data frames, one per page.
+
+    Args:
+        chunksize (int): Maximum number of logs per page. Defaults to
+          `PAGE_SIZE`.
+
+    Yields:
+        pd.DataFrame: Page of Cloud logs
+    """
+    start = datetime.datetime.strptime(
+        self._start, constants.TIME_REGEXP
+    ).isoformat()
+    end = datetime.datetime.strptime(
+        self._end, constants.TIME_REGEXP
+    ).isoformat()
+    request = self._build_request(
+        self._build_filter(),
+        start,
+        end,
+        page_size=chunksize,
+    )
+    pages = queue.Queue(maxsize=self._queue_size)
+    threading.Thread(
+        target=asyncio.run,
+        args=(self._fetch_pages(request, pages),),
+        daemon=True,
+    ).start()
+
+    i = 0
+    while (page := pages.get()) is not None:
+      if isinstance(page, Exception):
+        raise page
+      if not page.entries:
+        continue
+      if i == 0 and not self._validate_log_structure(page.entries[0]):
+        return
+      logger.debug("Reading log page#%d of [%s, %s]", i, start, end)
+      columns = {
+          name: [] for name in cloud_logging_log_reader.LOG_ENTRY_COLUMNS
+      }
+      self._append_entries(columns, page.entries)
+      i += 1
+      yield categorical_utils.to_categoricals(pd.DataFrame(columns))
+    logger.debug("Log reader completed.")
+
+  def read_logs(self) -> pd.DataFrame:
+    """Reads the logs into a pandas data frame.
+
+    Returns:
+        pd.DataFrame: Cloud logs
+    """
+    pages = list(self.read_logs_in_chunks())
+    if not pages:
+      return pd.DataFrame()
+    return categorical_utils.concat_logs(pages)
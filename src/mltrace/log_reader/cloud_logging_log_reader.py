@@ -14,30 +14,100 @@
 
 """Reads logs from Cloud Logging."""
 
+import concurrent.futures
 import datetime
 import logging
 import more_itertools
 import pandas as pd
+import time
+from typing import Iterator, Optional
 import urllib.parse
 
 from google.cloud import logging_v2
+from . import log_cache
 from . import log_reader
+from . import page_checkpoint
+from .. import categorical_utils
 from .. import constants
+from .. import rules
 
 PAGE_SIZE = 10000
+MAX_FETCH_WORKERS = 8
+# Overlap between consecutive polls when following the logs, to pick up logs
+# that arrive late.
+FOLLOW_LOOKBACK = datetime.timedelta(minutes=1)
+LOG_ENTRY_COLUMNS = [
+    "insertId",
+    "resource.labels.pod_name",
+    "resource.labels.container_name",
+    "project",
+    "cluster_name",
+    "location",
+    "timestamp",
+    "textPayload",
+    "jsonPayload.message",
+    "severity",
+    "sourceLocation.file",
+    "sourceLocation.line",
+    "labels",
+]
 logger = logging.getLogger(__name__)
 
+
+class _InvalidLogStructureError(Exception):
+  """Raised when the fetched logs don't have the expected structure.
+
+  The read is then abandoned without caching the time window as empty.
+  """
+
+
 class CloudLoggingLogReader(log_reader.LogReader):
   """Reads logs from Cloud Logging."""
 
   def __init__(
-      self, project_id: str, jobname: str, start: str, end: str, log_filter: str
+      self,
+      project_id: str,
+      jobname: str,
+      start: str,
+      end: str,
+      log_filter: str,
+      num_shards: int = 1,
+      num_workers: Optional[int] = None,
+      cache_dir: Optional[str] = None,
+      work_dir: Optional[str] = None,
+      resume: bool = False,
+      rule_set: Optional[rules.RuleSet] = None,
   ):
+    """Initializes the reader.
+
+    Args:
+        project_id (str): GCP project to read the logs from
+        jobname (str): Name of the job/jobset
+        start (str): Start of the time window
+        end (str): End of the time window
+        log_filter (str): Cloud Logging filter
+        num_shards (int): Number of sub-windows the time window is split into.
+          The sub-windows are fetched concurrently.
+        num_workers (int): Maximum number of sub-windows fetched at a time.
+          Defaults to the number of shards, capped at `MAX_FETCH_WORKERS`.
+        cache_dir (str): Optional directory where the fetched logs are cached.
+        work_dir (str): Optional directory where each fetched page is
+          checkpointed.
+        resume (bool): Whether to resume from the checkpoints in `work_dir`.
+        rule_set (rules.RuleSet): Rules of the redundant logs excluded by the
+          filter. Defaults to the built-in rules.
+    """
     self._project_id = project_id
     self._jobname = jobname
     self._start = start
     self._end = end
     self._log_filter = log_filter
+    self._num_shards = num_shards
+    self._num_workers = num_workers or min(num_shards, MAX_FETCH_WORKERS)
+    self._cache_dir = cache_dir
+    self._work_dir = work_dir
+    self._resume = resume
+    self._rule_set = rule_set or rules.get_default_rule_set()
 
   def _validate_log_structure(self, log: logging_v2.LogEntry) -> bool:
     """Validates the log structure.
@@ -68,87 +138,413 @@ class CloudLoggingLogReader(log_reader.LogReader):
       return False
     return True
 
+  def _build_filter(self) -> str:
+    """Builds the Cloud Logging filter, without the time window.
 
-  def read_logs(self) -> pd.DataFrame:
-    """Reads the logs into a pandas data frame.
+    Returns:
+        str: The filter that excludes the redundant logs
+    """
+    return f"{self._log_filter or ''} " + (
+        self._rule_set.build_cloud_logging_filter()
+    )
+
+  def _split_time_window(
+      self, start: datetime.datetime, end: datetime.datetime
+  ) -> list[tuple[str, str]]:
+    """Splits the time window into `num_shards` contiguous sub-windows.
+
+    Args:
+        start (datetime.datetime): Start of the time window
+        end (datetime.datetime): End of the time window
 
     Returns:
-        pd.DataFrame: Cloud logs
+        list[tuple[str, str]]: Start and end times of the sub-windows
     """
-    client = logging_v2.services.logging_service_v2.LoggingServiceV2Client()
-    self._log_filter += f' timestamp>="{self._start}" timestamp<="{self._end}" '
-    for regexp in constants.REDUNDANT_LOGS_SUBSTR_MATCH:
-      # Per Cloud Logging docs, regex patterns must be in double quotes.
-      # We must escape backslashes and double quotes inside the pattern.
-      r = regexp.replace('\\', '\\\\').replace('"', '\\"')
-      self._log_filter += f'textPayload!~"{r}" '
-
-    for regexp in constants.REDUNDANT_LOGS_EXACT:
-      r = regexp.replace('\\', '\\\\').replace('"', '\\"')
-      self._log_filter += f'textPayload!~"{r}" '
-
-    self._log_filter += " AND ".join([
-        f"sourceLocation.file!={filename} OR severity!={severity}"
-        for filename, severity in constants.REDUNDANT_SEVERITY_IN_FILES.items()
-    ])
-
-    request = logging_v2.types.ListLogEntriesRequest(
+    step = (end - start) / self._num_shards
+    bounds = [start + i * step for i in range(self._num_shards)] + [end]
+    return [
+        (bounds[i].isoformat(), bounds[i + 1].isoformat())
+        for i in range(self._num_shards)
+    ]
+
+  def _build_request(
+      self,
+      log_filter: str,
+      start: str,
+      end: str,
+      page_size: Optional[int] = None,
+  ) -> logging_v2.types.ListLogEntriesRequest:
+    """Builds the request that lists the logs of a time window.
+
+    Args:
+        log_filter (str): Filter without the time window
+        start (str): Start of the time window
+        end (str): End of the time window
+        page_size (int): Maximum number of logs per page. Defaults to
+          `PAGE_SIZE`.
+
+    Returns:
+        logging_v2.types.ListLogEntriesRequest: The request
+    """
+    page_size = page_size or PAGE_SIZE
+    logger.debug(
+        "Starting the log reader for [%s, %s] with page-size=%d",
+        start,
+        end,
+        page_size,
+    )
+    return logging_v2.types.ListLogEntriesRequest(
         resource_names=[f"projects/{self._project_id}"],
-        filter=self._log_filter,
-        page_size=PAGE_SIZE,
+        filter=f'{log_filter} timestamp>="{start}" timestamp<="{end}" ',
+        page_size=page_size,
     )
-    logger.debug("Starting the log reader with page-size=%d", PAGE_SIZE)
+
+  def _append_entries(
+      self, columns: dict[str, list], entries: list[logging_v2.LogEntry]
+  ):
+    """Appends the fields of the log entries to the column buffers.
+
+    Args:
+        columns (dict[str, list]): Column buffers keyed by LOG_ENTRY_COLUMNS
+        entries (list[logging_v2.LogEntry]): Log entries
+    """
+    (
+        insert_ids,
+        pod_names,
+        container_names,
+        projects,
+        cluster_names,
+        locations,
+        timestamps,
+        text_payloads,
+        json_messages,
+        severities,
+        files,
+        lines,
+        labels,
+    ) = (columns[name] for name in LOG_ENTRY_COLUMNS)
+    for log in entries:
+      resource_labels = log.resource.ListFields()[1][1]
+      json_payload = log.json_payload
+      if json_payload is not None:
+        json_payload = json_payload.get("message")
+      insert_ids.append(log.insert_id)
+      pod_names.append(resource_labels["pod_name"])
+      container_names.append(resource_labels["container_name"])
+      projects.append(resource_labels["project_id"])
+      cluster_names.append(resource_labels["cluster_name"])
+      locations.append(resource_labels["location"])
+      timestamps.append(log.timestamp)
+      text_payloads.append(log.text_payload)
+      json_messages.append(json_payload)
+      severities.append(log.severity.name)
+      files.append(log.source_location.file)
+      lines.append(log.source_location.line)
+      labels.append(dict(log.labels))
+
+  def _read_time_window(
+      self,
+      client: logging_v2.services.logging_service_v2.LoggingServiceV2Client,
+      log_filter: str,
+      start: str,
+      end: str,
+  ) -> pd.DataFrame:
+    """Reads the logs of a single time window into a pandas data frame.
+
+    Args:
+        client: Cloud Logging client
+        log_filter (str): Filter without the time window
+        start (str): Start of the time window
+        end (str): End of the time window
+
+    Returns:
+        pd.DataFrame: Cloud logs
+
+    Raises:
+        _InvalidLogStructureError: If the logs don't have the expected
+          structure
+    """
+    if self._work_dir is not None:
+      return self._read_time_window_with_checkpoint(
+          client, log_filter, start, end
+      )
+    request = self._build_request(log_filter, start, end)
     log_pages = client.list_log_entries(request=request).pages
     p = more_itertools.peekable(log_pages)
-    plog = p.peek().entries[0]
-    if not self._validate_log_structure(plog):
+    first_page = p.peek(None)
+    if first_page is None or not first_page.entries:
+      return pd.DataFrame()
+    if not self._validate_log_structure(first_page.entries[0]):
+      raise _InvalidLogStructureError()
+
+    columns = {name: [] for name in LOG_ENTRY_COLUMNS}
+    for i, page in enumerate(p):
+      logger.debug("Reading log page#%d of [%s, %s]", i, start, end)
+      self._append_entries(columns, page.entries)
+    return categorical_utils.to_categoricals(pd.DataFrame(columns))
+
+  def _read_time_window_with_checkpoint(
+      self,
+      client: logging_v2.services.logging_service_v2.LoggingServiceV2Client,
+      log_filter: str,
+      start: str,
+      end: str,
+  ) -> pd.DataFrame:
+    """Reads the logs of a single time window, checkpointing every page.
+
+    Each completed page is spilled to the work directory along with the token
+    of the next page. When resuming, the spilled pages are loaded and the read
+    continues from the next page token.
+
+    Args:
+        client: Cloud Logging client
+        log_filter (str): Filter without the time window
+        start (str): Start of the time window
+        end (str): End of the time window
+
+    Returns:
+        pd.DataFrame: Cloud logs
+
+    Raises:
+        _InvalidLogStructureError: If the logs don't have the expected
+          structure
+    """
+    checkpoint = page_checkpoint.PageCheckpoint(
+        self._work_dir, self._project_id, log_filter, start, end
+    )
+    if not (self._resume and checkpoint.restore()):
+      checkpoint.reset()
+    pages = checkpoint.load_pages()
+    if not checkpoint.completed:
+      request = self._build_request(log_filter, start, end)
+      if checkpoint.next_page_token:
+        request.page_token = checkpoint.next_page_token
+      for page in client.list_log_entries(request=request).pages:
+        if (
+            checkpoint.num_pages == 0
+            and page.entries
+            and not self._validate_log_structure(page.entries[0])
+        ):
+          raise _InvalidLogStructureError()
+        logger.debug(
+            "Reading log page#%d of [%s, %s]", checkpoint.num_pages, start, end
+        )
+        columns = {name: [] for name in LOG_ENTRY_COLUMNS}
+        self._append_entries(columns, page.entries)
+        pages.append(categorical_utils.to_categoricals(pd.DataFrame(columns)))
+        checkpoint.save_page(pages[-1], page.next_page_token)
+    pages = [logs for logs in pages if len(logs)]
+    if not pages:
+      return pd.DataFrame()
+    return categorical_utils.concat_logs(pages)
+
+  def add_derived_columns(self, logs: pd.DataFrame) -> pd.DataFrame:
+    """Adds the `logLink` column that links each log to the Logs Explorer.
+
+    The links are only built for the logs that remain after parsing.
+
+    Args:
+        logs (pd.DataFrame): Parsed logs
+
+    Returns:
+        pd.DataFrame: Logs with a new "logLink" column
+    """
+    if len(logs) == 0:
+      return logs
+    timestamps = pd.to_datetime(logs["timestamp"], utc=True)
+    one_us = pd.Timedelta(microseconds=1)
+    start_strs = (timestamps - one_us).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    end_strs = (timestamps + one_us).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    links = []
+    for text_payload, json_payload, start_str, end_str in zip(
+        logs["textPayload"],
+        logs["jsonPayload.message"],
+        start_strs,
+        end_strs,
+    ):
+      # The parser falls back to the JSON message for logs without a text
+      # payload, in which case the query only matches on the JSON message.
+      query_parts = []
+      if text_payload and text_payload != json_payload:
+        query_parts.append(f'textPayload="{text_payload}"')
+      if json_payload:
+        query_parts.append(f'jsonPayload.message="{json_payload}"')
+      query_parts.append(f'timestamp>="{start_str}"')
+      query_parts.append(f'timestamp<="{end_str}"')
+
+      encoded_query = urllib.parse.quote("\n".join(query_parts))
+      links.append(
+          "https://pantheon.corp.google.com/logs/query;query="
+          f"{encoded_query}?project={self._project_id}"
+      )
+    return logs.assign(logLink=links)
+
+  def _read_time_range(
+      self,
+      client: logging_v2.services.logging_service_v2.LoggingServiceV2Client,
+      log_filter: str,
+      start: datetime.datetime,
+      end: datetime.datetime,
+  ) -> pd.DataFrame:
+    """Reads the logs of a time window, split into shards if requested.
+
+    The shards are merged in timestamp order and deduplicated by `insertId`,
+    as adjacent sub-windows share their boundaries.
+
+    Args:
+        client: Cloud Logging client
+        log_filter (str): Filter without the time window
+        start (datetime.datetime): Start of the time window
+        end (datetime.datetime): End of the time window
+
+    Returns:
+        pd.DataFrame: Cloud logs
+
+    Raises:
+        _InvalidLogStructureError: If the logs don't have the expected
+          structure
+    """
+    if self._num_shards <= 1:
+      return self._read_time_window(
+          client, log_filter, start.isoformat(), end.isoformat()
+      )
+
+    windows = self._split_time_window(start, end)
+    logger.debug(
+        "Fetching %d time shards with %d workers",
+        len(windows),
+        self._num_workers,
+    )
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self._num_workers
+    ) as executor:
+      shards = list(
+          executor.map(
+              lambda w: self._read_time_window(client, log_filter, *w),
+              windows,
+          )
+      )
+    shards = [shard for shard in shards if len(shard)]
+    if not shards:
       return pd.DataFrame()
+    return (
+        categorical_utils.concat_logs(shards)
+        .sort_values("timestamp", kind="stable")
+        .drop_duplicates(subset="insertId")
+        .reset_index(drop=True)
+    )
+
+  def read_logs(self) -> pd.DataFrame:
+    """Reads the logs into a pandas data frame.
+
+    With a cache directory, only the parts of the time window that are not
+    cached yet are fetched from Cloud Logging, and merged with the cached logs.
 
-    l = []  # List to store the logs
-    for i, page in enumerate(log_pages):
-      logger.debug("Reading log page#%d", i)
-      for log in page.entries:
-        json_payload = log.json_payload
-        if json_payload is not None:
-          json_payload = json_payload.get("message")
-        start_t = log.timestamp - datetime.timedelta(microseconds=1)
-        start_str = start_t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-        end_t = log.timestamp + datetime.timedelta(microseconds=1)
-        end_str = end_t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-
-        # Safely build the query string parts.
-        query_parts = []
-        if log.text_payload:
-          query_parts.append(f'textPayload="{log.text_payload}"')
-        if json_payload:
-          query_parts.append(f'jsonPayload.message="{json_payload}"')
-        query_parts.append(f'timestamp>="{start_str}"')
-        query_parts.append(f'timestamp<="{end_str}"')
-
-        log_query = "\n".join(query_parts)
-        encoded_query = urllib.parse.quote(log_query)
-
-        l.append({
-            "resource.labels.pod_name": log.resource.ListFields()[1][1][
-                "pod_name"
-            ],
-            "resource.labels.container_name": log.resource.ListFields()[1][1][
-                "container_name"
-            ],
-            "project": log.resource.ListFields()[1][1]["project_id"],
-            "cluster_name": log.resource.ListFields()[1][1]["cluster_name"],
-            "location": log.resource.ListFields()[1][1]["location"],
-            "timestamp": log.timestamp,
-            "textPayload": log.text_payload,
-            "jsonPayload.message": json_payload,
-            "severity": log.severity,
-            "sourceLocation.file": log.source_location.file,
-            "sourceLocation.line": log.source_location.line,
-            "labels": log.labels,
-            "logLink": (
-                "https://pantheon.corp.google.com/logs/query;query="
-                f"{encoded_query}?project={self._project_id}"
-            ),
-        })
+    Returns:
+        pd.DataFrame: Cloud logs
+    """
+    client = logging_v2.services.logging_service_v2.LoggingServiceV2Client()
+    log_filter = self._build_filter()
+    start = datetime.datetime.strptime(self._start, constants.TIME_REGEXP)
+    end = datetime.datetime.strptime(self._end, constants.TIME_REGEXP)
+    try:
+      if self._cache_dir is None:
+        logs = self._read_time_range(client, log_filter, start, end)
+      else:
+        logs = self._read_time_range_with_cache(
+            client, log_filter, start, end
+        )
+    except _InvalidLogStructureError:
+      logs = pd.DataFrame()
     logger.debug("Log reader completed.")
-    return pd.DataFrame(l)
+    return logs
+
+  def _read_time_range_with_cache(
+      self,
+      client: logging_v2.services.logging_service_v2.LoggingServiceV2Client,
+      log_filter: str,
+      start: datetime.datetime,
+      end: datetime.datetime,
+  ) -> pd.DataFrame:
+    """Reads the logs of a time window, only fetching the uncached parts.
+
+    Args:
+        client: Cloud Logging client
+        log_filter (str): Filter without the time window
+        start (datetime.datetime): Start of the time window
+        end (datetime.datetime): End of the time window
+
+    Returns:
+        pd.DataFrame: Cloud logs
+
+    Raises:
+        _InvalidLogStructureError: If the fetched logs don't have the expected
+          structure, in which case the failed window is not cached
+    """
+    cache = log_cache.LogCache(self._cache_dir, self._project_id, log_filter)
+    fetched = []
+    for missing_start, missing_end in cache.get_missing_windows(start, end):
+      logger.info(
+          "Fetching [%s, %s], which is not cached yet.",
+          missing_start,
+          missing_end,
+      )
+      window_logs = self._read_time_range(
+          client, log_filter, missing_start, missing_end
+      )
+      cache.store(missing_start, missing_end, window_logs)
+      fetched.append(window_logs)
+    # The most recent logs are not cached, see `log_cache.LATE_ARRIVAL_MARGIN`,
+    # so the fetched logs are merged with the cached ones rather than reloaded.
+    frames = [
+        frame for frame in [cache.load(start, end), *fetched] if len(frame)
+    ]
+    if not frames:
+      return pd.DataFrame()
+    return (
+        categorical_utils.concat_logs(frames)
+        .sort_values("timestamp", kind="stable")
+        .drop_duplicates(subset="insertId")
+        .reset_index(drop=True)
+    )
+
+  def follow_logs(self, poll_interval: float) -> Iterator[pd.DataFrame]:
+    """Tails the logs, starting at the start of the time window.
+
+    Every `poll_interval` seconds, the logs that arrived since the previous
+    poll are read and yielded. Each poll overlaps the previous one by
+    `FOLLOW_LOOKBACK` and drops the logs it has already yielded. Runs until
+    interrupted.
+
+    Args:
+        poll_interval (float): Seconds between two polls
+
+    Yields:
+        pd.DataFrame: New Cloud logs
+    """
+    client = logging_v2.services.logging_service_v2.LoggingServiceV2Client()
+    log_filter = self._build_filter()
+    cursor = datetime.datetime.strptime(self._start, constants.TIME_REGEXP)
+    seen = {}  # insertId -> timestamp of the logs yielded after the lookback.
+    while True:
+      now = datetime.datetime.now(datetime.timezone.utc)
+      try:
+        logs = self._read_time_window(
+            client,
+            log_filter,
+            (cursor - FOLLOW_LOOKBACK).isoformat(),
+            now.isoformat(),
+        )
+      except _InvalidLogStructureError:
+        logs = pd.DataFrame()
+      if len(logs):
+        logs = logs[~logs["insertId"].isin(seen.keys())]
+      logger.debug("Found %d new logs until %s", len(logs), now)
+      if len(logs):
+        seen.update(
+            zip(logs["insertId"], pd.to_datetime(logs["timestamp"], utc=True))
+        )
+        yield logs.reset_index(drop=True)
+      cursor = now
+      seen = {k: t for k, t in seen.items() if t >= cursor - FOLLOW_LOOKBACK}
+      time.sleep(poll_interval)
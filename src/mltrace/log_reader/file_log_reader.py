@@ -15,12 +15,32 @@
 """File log reader.
 """
 
+import bz2
+import datetime
+import gzip
 import logging
 import pathlib
+from typing import Iterator, Optional
 
 import pandas as pd
 
 from . import log_reader
+from .. import categorical_utils
+from .. import constants
+
+try:
+  import pyarrow as pa
+  from pyarrow import compute as pa_compute
+  from pyarrow import dataset as pa_dataset
+except ImportError:
+  pa = None
+  pa_compute = None
+  pa_dataset = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +48,49 @@ logger = logging.getLogger(__name__)
 class FileLogReader(log_reader.LogReader):
   """Reads logs from a file into a pandas data frame."""
 
-  def __init__(self, filename: str):
+  def __init__(
+      self,
+      filename: str,
+      start: Optional[str] = None,
+      end: Optional[str] = None,
+  ):
+    """Initializes the reader.
+
+    Args:
+        filename (str): Path to the log file
+        start (str): Optional start of the time window. Only applied to
+          columnar files, where it is pushed down into the scan.
+        end (str): Optional end of the time window. Only applied to columnar
+          files, where it is pushed down into the scan.
+    """
     self._filename = filename
+    self._start = start
+    self._end = end
+    # Compound suffixes such as `.jsonl.gz` are decompressed while reading.
+    suffixes = pathlib.Path(filename).suffixes
+    self._compression = (
+        constants.COMPRESSED_FILE_SUFFIXES.get(suffixes[-1])
+        if suffixes
+        else None
+    )
+    if self._compression is not None:
+      suffixes = suffixes[:-1]
+    self._file_ext = suffixes[-1] if suffixes else ""
+
+  def _open_text(self):
+    """Opens the file for reading text, decompressing it if needed."""
+    if self._compression == "gzip":
+      return gzip.open(self._filename, "rt")
+    if self._compression == "bz2":
+      return bz2.open(self._filename, "rt")
+    if self._compression == "zstd":
+      if zstandard is None:
+        raise ImportError(
+            "Reading .zst files requires zstandard. Install it with"
+            " `pip install zstandard`."
+        )
+      return zstandard.open(self._filename, "rt")
+    return open(self._filename, "r")
 
   def _read_logs_from_csv(self) -> pd.DataFrame:
     """Reads the logs into a pandas data frame.
@@ -37,7 +98,9 @@ class FileLogReader(log_reader.LogReader):
     Returns:
         pd.DataFrame: File logs
     """
-    logs = pd.read_csv(self._filename, sep=",")
+    logs = pd.read_csv(
+        self._filename, sep=",", compression=self._compression
+    )
     logger.info("Found %d records with columns: %s", logs.size, logs.columns)
     return logs
 
@@ -49,13 +112,197 @@ class FileLogReader(log_reader.LogReader):
     """
     try:
       # Try to read as a standard JSON array first. This will fail for JSONL.
-      logs = pd.read_json(self._filename)
+      logs = pd.read_json(self._filename, compression=self._compression)
     except ValueError:
       # If that fails, it might be a JSON Lines file.
-      logs = pd.read_json(self._filename, lines=True)
+      logs = pd.read_json(
+          self._filename, lines=True, compression=self._compression
+      )
+    logger.info("Found %d records with columns: %s", logs.size, logs.columns)
+    return logs
+
+  def _open_columnar_dataset(self, file_format: str):
+    """Opens the Parquet/Arrow file as a pyarrow dataset."""
+    if self._compression is not None:
+      raise ValueError(
+          f"Compressed {self._file_ext} files are not supported. Parquet and"
+          " Arrow files are compressed internally."
+      )
+    if pa_dataset is None:
+      raise ImportError(
+          "Reading Parquet/Arrow files requires pyarrow. Install it with"
+          " `pip install pyarrow`."
+      )
+    return pa_dataset.dataset(self._filename, format=file_format)
+
+  def _get_projection(self, schema) -> dict:
+    """Returns the projection of the schema onto the columns used downstream.
+
+    Nested fields (e.g. `resource.labels.pod_name`) are projected into flat
+    columns, so only their leaf columns are read from the file. Columns that
+    are missing from the file are read as nulls.
+    """
+    projection = {}
+    for name in constants.LOG_COLUMNS:
+      if name in schema.names:
+        projection[name] = pa_dataset.field(name)
+        continue
+      path = name.split(".")
+      fields = schema
+      for key in path:
+        index = fields.get_field_index(key) if fields is not None else -1
+        if index < 0:
+          break
+        fields = fields.field(index).type
+        if not pa.types.is_struct(fields):
+          fields = None
+      else:
+        projection[name] = pa_dataset.field(*path)
+        continue
+      projection[name] = pa_compute.scalar(pa.scalar(None, pa.string()))
+    logger.debug("Reading columns: %s", list(projection))
+    return projection
+
+  def _get_time_filter(self, schema):
+    """Returns the time window filter expression to push down into the scan."""
+    if self._start is None and self._end is None:
+      return None
+    index = schema.get_field_index("timestamp")
+    if index < 0 or not pa.types.is_timestamp(schema.field(index).type):
+      logger.warning(
+          "The time window is not applied to %s, as it has no `timestamp`"
+          " column of a timestamp type.",
+          self._filename,
+      )
+      return None
+    ts_type = schema.field(index).type
+
+    def to_scalar(t):
+      t = datetime.datetime.strptime(t, constants.TIME_REGEXP)
+      t = t.astimezone(datetime.timezone.utc)
+      if ts_type.tz is None:
+        t = t.replace(tzinfo=None)
+      return pa.scalar(t, ts_type)
+
+    timestamp = pa_dataset.field("timestamp")
+    time_filter = None
+    if self._start is not None:
+      time_filter = timestamp >= to_scalar(self._start)
+    if self._end is not None:
+      end_filter = timestamp <= to_scalar(self._end)
+      time_filter = (
+          end_filter if time_filter is None else time_filter & end_filter
+      )
+    return time_filter
+
+  def _read_logs_from_columnar(self, file_format: str) -> pd.DataFrame:
+    """Reads the columnar logs into a pandas data frame.
+
+    Returns:
+        pd.DataFrame: File logs
+    """
+    dataset = self._open_columnar_dataset(file_format)
+    logs = dataset.to_table(
+        columns=self._get_projection(dataset.schema),
+        filter=self._get_time_filter(dataset.schema),
+    ).to_pandas()
     logger.info("Found %d records with columns: %s", logs.size, logs.columns)
     return logs
 
+  def _read_chunks_from_columnar(
+      self, file_format: str, chunksize: int
+  ) -> Iterator[pd.DataFrame]:
+    """Reads the columnar logs in chunks of at most `chunksize` records."""
+    dataset = self._open_columnar_dataset(file_format)
+    for batch in dataset.to_batches(
+        columns=self._get_projection(dataset.schema),
+        filter=self._get_time_filter(dataset.schema),
+        batch_size=chunksize,
+    ):
+      if batch.num_rows:
+        yield batch.to_pandas()
+
+  def _is_json_array(self) -> bool:
+    """Checks whether the JSON file holds a single array rather than lines."""
+    with self._open_text() as fp:
+      for line in fp:
+        stripped = line.lstrip()
+        if stripped:
+          return stripped.startswith("[")
+    return False
+
+  def _read_chunks_from_csv(self, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Reads the CSV logs in chunks of at most `chunksize` records."""
+    with pd.read_csv(
+        self._filename,
+        sep=",",
+        chunksize=chunksize,
+        compression=self._compression,
+    ) as reader:
+      yield from reader
+
+  def _read_chunks_from_json(self, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Reads the JSON logs in chunks of at most `chunksize` records."""
+    if self._is_json_array():
+      # A JSON array can only be parsed as a whole, so fall back to slicing
+      # the fully loaded data frame.
+      logger.warning(
+          "%s holds a JSON array and cannot be streamed. Export the logs as"
+          " JSON Lines to bound the memory usage.",
+          self._filename,
+      )
+      logs = self._read_logs_from_json()
+      for start in range(0, len(logs), chunksize):
+        yield logs.iloc[start:start + chunksize].copy()
+      return
+    with pd.read_json(
+        self._filename,
+        lines=True,
+        chunksize=chunksize,
+        compression=self._compression,
+    ) as reader:
+      yield from reader
+
+  def read_logs_in_chunks(self, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Reads the logs as a sequence of data frames.
+
+    Only one chunk is held in memory at a time, so the memory usage is bounded
+    by the chunk size rather than the file size.
+
+    Args:
+        chunksize (int): Maximum number of records per chunk
+
+    Yields:
+        pd.DataFrame: Chunk of file logs
+
+    Raises:
+        ValueError if the given file is neither CSV, JSON, Parquet nor Arrow
+    """
+    file_ext = self._file_ext
+    logger.info(
+        "Starting the chunked log reader for file: %s with chunksize=%d",
+        self._filename,
+        chunksize,
+    )
+    if file_ext == ".csv":
+      chunks = self._read_chunks_from_csv(chunksize)
+    elif file_ext in [".json", ".jsonl"]:
+      chunks = self._read_chunks_from_json(chunksize)
+    elif file_ext in constants.COLUMNAR_FILE_FORMATS:
+      chunks = self._read_chunks_from_columnar(
+          constants.COLUMNAR_FILE_FORMATS[file_ext], chunksize
+      )
+    else:
+      raise ValueError(
+          f"Invalid file type \"{file_ext}\". Supported: .csv and .json[l]"
+          " (optionally compressed as .gz, .bz2 or .zst), .parquet and"
+          " .arrow/.feather"
+      )
+    for i, chunk in enumerate(chunks):
+      logger.debug("Read chunk#%d with %d records", i, len(chunk))
+      yield categorical_utils.to_categoricals(chunk)
+    logger.debug("Log reader completed.")
+
   def read_logs(self) -> pd.DataFrame:
     """Reads the logs into a pandas data frame.
 
@@ -63,17 +310,23 @@ class FileLogReader(log_reader.LogReader):
         pd.DataFrame: File logs
 
     Raises:
-        ValueError if the given file is neither CSV nor JSON
+        ValueError if the given file is neither CSV, JSON, Parquet nor Arrow
     """
-    file_ext = pathlib.Path(self._filename).suffix
+    file_ext = self._file_ext
     logger.info("Starting the log reader for file: %s", self._filename)
     if file_ext == ".csv":
       logs = self._read_logs_from_csv()
     elif file_ext in [".json", ".jsonl"]:
       logs = self._read_logs_from_json()
+    elif file_ext in constants.COLUMNAR_FILE_FORMATS:
+      logs = self._read_logs_from_columnar(
+          constants.COLUMNAR_FILE_FORMATS[file_ext]
+      )
     else:
       raise ValueError(
           f"Invalid file type \"{file_ext}\". Supported: .csv and .json[l]"
+          " (optionally compressed as .gz, .bz2 or .zst), .parquet and"
+          " .arrow/.feather"
       )
     logger.debug("Log reader completed.")
-    return logs
+    return categorical_utils.to_categoricals(logs)
@@ -0,0 +1,212 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of the logs read from Cloud Logging.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+from .. import categorical_utils
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+# Logs can show up in Cloud Logging a while after their timestamp. The most
+# recent part of a time window is not cached, so that a rerun fetches it again.
+LATE_ARRIVAL_MARGIN = datetime.timedelta(minutes=5)
+
+
+def write_logs(logs: pd.DataFrame, path: str):
+  """Writes the logs to a Parquet file.
+
+  Args:
+    logs (pd.DataFrame): Cloud logs
+    path (str): Path to the Parquet file
+  """
+  if "labels" in logs.columns:
+    logs = logs.assign(labels=logs["labels"].map(json.dumps))
+  logs.to_parquet(path, index=False)
+
+
+def read_logs(path: str) -> pd.DataFrame:
+  """Reads the logs written by `write_logs`.
+
+  Args:
+    path (str): Path to the Parquet file
+
+  Returns:
+    pd.DataFrame: Cloud logs
+  """
+  logs = pd.read_parquet(path)
+  if "labels" in logs.columns:
+    logs["labels"] = logs["labels"].map(json.loads)
+  return logs
+
+
+def get_query_key(project_id: str, log_filter: str) -> str:
+  """Returns the cache key of a query.
+
+  Args:
+    project_id (str): GCP project of the query
+    log_filter (str): Cloud Logging filter of the query, without the time
+      window
+
+  Returns:
+    str: Hex digest identifying the query
+  """
+  normalized_filter = " ".join(log_filter.split())
+  return hashlib.sha256(
+      f"{project_id}\n{normalized_filter}".encode()
+  ).hexdigest()
+
+
+class LogCache:
+  """Caches the logs of a Cloud Logging query as Parquet segments.
+
+  Each query has its own directory holding one Parquet file per fetched time
+  window. A manifest records the time window covered by each segment, so that
+  only the parts of a requested window that are not covered yet are fetched.
+  """
+
+  def __init__(self, cache_dir: str, project_id: str, log_filter: str):
+    self._dir = os.path.join(cache_dir, get_query_key(project_id, log_filter))
+    os.makedirs(self._dir, exist_ok=True)
+    self._manifest_path = os.path.join(self._dir, MANIFEST_FILENAME)
+    self._segments = self._load_manifest()
+
+  def _load_manifest(self) -> list[dict]:
+    if not os.path.exists(self._manifest_path):
+      return []
+    with open(self._manifest_path, "r") as fp:
+      return json.load(fp)
+
+  def _save_manifest(self):
+    tmp_path = self._manifest_path + ".tmp"
+    with open(tmp_path, "w") as fp:
+      json.dump(self._segments, fp)
+    os.replace(tmp_path, self._manifest_path)
+
+  def _covered_windows(self) -> list[tuple[datetime.datetime,
+                                           datetime.datetime]]:
+    """Returns the merged time windows covered by the cached segments."""
+    windows = sorted(
+        (
+            datetime.datetime.fromisoformat(s["start"]),
+            datetime.datetime.fromisoformat(s["end"]),
+        )
+        for s in self._segments
+    )
+    merged = []
+    for start, end in windows:
+      if merged and start <= merged[-1][1]:
+        merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+      else:
+        merged.append((start, end))
+    return merged
+
+  def get_missing_windows(
+      self, start: datetime.datetime, end: datetime.datetime
+  ) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """Returns the parts of the time window that are not cached.
+
+    Args:
+      start (datetime.datetime): Start of the time window
+      end (datetime.datetime): End of the time window
+
+    Returns:
+      list[tuple[datetime.datetime, datetime.datetime]]: Uncovered windows
+    """
+    missing = []
+    cursor = start
+    for covered_start, covered_end in self._covered_windows():
+      if covered_end < cursor:
+        continue
+      if covered_start > end:
+        break
+      if covered_start > cursor:
+        missing.append((cursor, covered_start))
+      cursor = max(cursor, covered_end)
+    if cursor < end:
+      missing.append((cursor, end))
+    return missing
+
+  def store(
+      self,
+      start: datetime.datetime,
+      end: datetime.datetime,
+      logs: pd.DataFrame,
+  ):
+    """Stores the logs fetched for a time window.
+
+    Args:
+      start (datetime.datetime): Start of the fetched time window
+      end (datetime.datetime): End of the fetched time window
+      logs (pd.DataFrame): Logs fetched for the time window
+    """
+    end = min(
+        end, datetime.datetime.now(datetime.timezone.utc) - LATE_ARRIVAL_MARGIN
+    )
+    if end <= start:
+      return
+    filename = None
+    if len(logs):
+      logs = logs[pd.to_datetime(logs["timestamp"], utc=True) <= end]
+    if len(logs):
+      filename = f"{start.timestamp():.6f}-{end.timestamp():.6f}.parquet"
+      write_logs(logs, os.path.join(self._dir, filename))
+    self._segments.append({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "file": filename,
+    })
+    self._save_manifest()
+    logger.debug("Cached %d logs for [%s, %s]", len(logs), start, end)
+
+  def load(
+      self, start: datetime.datetime, end: datetime.datetime
+  ) -> pd.DataFrame:
+    """Loads the cached logs of a time window.
+
+    Args:
+      start (datetime.datetime): Start of the time window
+      end (datetime.datetime): End of the time window
+
+    Returns:
+      pd.DataFrame: Cached logs in timestamp order
+    """
+    frames = []
+    for segment in self._segments:
+      if (
+          segment["file"] is None
+          or datetime.datetime.fromisoformat(segment["end"]) < start
+          or datetime.datetime.fromisoformat(segment["start"]) > end
+      ):
+        continue
+      frames.append(read_logs(os.path.join(self._dir, segment["file"])))
+    if not frames:
+      return pd.DataFrame()
+    logs = categorical_utils.concat_logs(frames)
+    timestamps = pd.to_datetime(logs["timestamp"], utc=True)
+    return (
+        logs[(timestamps >= start) & (timestamps <= end)]
+        .sort_values("timestamp", kind="stable")
+        .drop_duplicates(subset="insertId")
+        .reset_index(drop=True)
+    )
@@ -16,6 +16,9 @@
 """
 
 import abc
+from typing import Iterator
+
+import pandas as pd
 
 
 class LogReader(metaclass=abc.ABCMeta):
@@ -24,3 +27,30 @@ class LogReader(metaclass=abc.ABCMeta):
   @abc.abstractmethod
   def read_logs(self):
     pass
+
+  def read_logs_in_chunks(self, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Reads the logs as a sequence of data frames.
+
+    Readers that cannot stream their input return all the logs as one chunk.
+
+    Args:
+        chunksize (int): Maximum number of records per chunk
+
+    Yields:
+        pd.DataFrame: Chunk of logs
+    """
+    del chunksize  # Unused.
+    yield self.read_logs()
+
+  def add_derived_columns(self, logs: pd.DataFrame) -> pd.DataFrame:
+    """Adds the columns that are derived from the parsed logs.
+
+    Deriving the columns after parsing skips the logs that were filtered out.
+
+    Args:
+        logs (pd.DataFrame): Parsed logs
+
+    Returns:
+        pd.DataFrame: Logs with the derived columns
+    """
+    return logs
@@ -0,0 +1,115 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checkpoints of the pages read from Cloud Logging.
+"""
+
+import json
+import logging
+import os
+import shutil
+from typing import Optional
+
+import pandas as pd
+
+from . import log_cache
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILENAME = "checkpoint.json"
+
+
+class PageCheckpoint:
+  """Spills the pages read for a time window to a work directory.
+
+  Each completed page is written as a Parquet file, and the token of the next
+  page is recorded in a checkpoint file. An interrupted read can then continue
+  from the last completed page instead of starting over.
+  """
+
+  def __init__(
+      self,
+      work_dir: str,
+      project_id: str,
+      log_filter: str,
+      start: str,
+      end: str,
+  ):
+    self._dir = os.path.join(
+        work_dir,
+        log_cache.get_query_key(project_id, f"{log_filter} {start} {end}"),
+    )
+    self._checkpoint_path = os.path.join(self._dir, CHECKPOINT_FILENAME)
+    self.num_pages = 0
+    self.next_page_token = None
+    self.completed = False
+
+  def _page_path(self, index: int) -> str:
+    return os.path.join(self._dir, f"page-{index:06d}.parquet")
+
+  def reset(self):
+    """Discards the pages of a previous read."""
+    shutil.rmtree(self._dir, ignore_errors=True)
+    os.makedirs(self._dir)
+    self.num_pages = 0
+    self.next_page_token = None
+    self.completed = False
+
+  def restore(self) -> bool:
+    """Restores the state of a previous read.
+
+    Returns:
+      bool: Whether a previous read was found
+    """
+    if not os.path.exists(self._checkpoint_path):
+      return False
+    with open(self._checkpoint_path, "r") as fp:
+      checkpoint = json.load(fp)
+    self.num_pages = checkpoint["num_pages"]
+    self.next_page_token = checkpoint["next_page_token"]
+    self.completed = not self.next_page_token
+    logger.info(
+        "Resuming from page#%d of a previous read%s.",
+        self.num_pages,
+        " that completed" if self.completed else "",
+    )
+    return True
+
+  def save_page(self, logs: pd.DataFrame, next_page_token: Optional[str]):
+    """Saves a completed page along with the token of the next page.
+
+    Args:
+      logs (pd.DataFrame): Logs of the page
+      next_page_token (str): Token of the next page, empty for the last page
+    """
+    log_cache.write_logs(logs, self._page_path(self.num_pages))
+    self.num_pages += 1
+    self.next_page_token = next_page_token
+    self.completed = not next_page_token
+    tmp_path = self._checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as fp:
+      json.dump(
+          {"num_pages": self.num_pages, "next_page_token": next_page_token}, fp
+      )
+    os.replace(tmp_path, self._checkpoint_path)
+
+  def load_pages(self) -> list[pd.DataFrame]:
+    """Loads the saved pages.
+
+    Returns:
+      list[pd.DataFrame]: Logs of the saved pages, in order
+    """
+    return [
+        log_cache.read_logs(self._page_path(i)) for i in range(self.num_pages)
+    ]
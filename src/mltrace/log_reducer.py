@@ -0,0 +1,257 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stages that reduce the number of trace events before the translation."""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from . import categorical_utils
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+TRACK_COLUMNS = ["parent", "section"]
+# Columns that identify the worker of a log, which don't apply to a log folded
+# across workers.
+WORKER_COLUMNS = ["worker_num", "resource.labels.pod_name"]
+
+
+def _get_sample_mask(
+    ranks: np.ndarray, run_sizes: np.ndarray, max_samples: int
+) -> np.ndarray:
+  """Selects up to `max_samples` evenly spaced logs of each run.
+
+  Args:
+      ranks (np.ndarray): Rank of each log within its run
+      run_sizes (np.ndarray): Size of the run of each log
+      max_samples (int): Maximum number of samples per run
+
+  Returns:
+      np.ndarray: Whether each log is a sample
+  """
+  num_samples = np.minimum(run_sizes, max_samples)
+  if max_samples <= 1:
+    return (ranks == 0) & (num_samples > 0)
+  # Sample j of a run of size s is its log of rank j * (s - 1) // (m - 1).
+  # Find the first sample at or after each rank, and check that it's the log.
+  span = np.maximum(run_sizes - 1, 1)
+  steps = np.maximum(num_samples - 1, 1)
+  samples = (ranks * steps + span - 1) // span
+  return (samples < num_samples) & (samples * span // steps == ranks)
+
+
+def collapse_repeats(logs: pd.DataFrame, max_samples: int = 0) -> pd.DataFrame:
+  """Collapses consecutive identical logs of each track into one log.
+
+  A run of consecutive logs with the same text on the same parent/section is
+  replaced with its first log, with the number of logs in the run as
+  "repeat_count" and the timestamp of its last log as "last_timestamp". These
+  columns are only set for runs of more than one log, which the translator
+  turns into slices from the first to the last log. The logs are sorted by
+  time first, e.g. for exports in descending time order, so that every slice
+  ends at or after its start. Runs are not merged across chunks.
+
+  Args:
+      logs (pd.DataFrame): Parsed logs
+      max_samples (int): Number of logs of each run that are also kept as
+        they are, evenly spaced from the first to the last log of the run.
+        The first one is the collapsed log.
+
+  Returns:
+      pd.DataFrame: Logs with the runs collapsed
+  """
+  if len(logs) == 0:
+    return logs
+  times = pd.to_datetime(logs["timestamp"], utc=True, format="ISO8601")
+  if not times.is_monotonic_increasing:
+    logs = logs.iloc[np.argsort(times.to_numpy(), kind="stable")]
+  tracks = (
+      logs.groupby(TRACK_COLUMNS, sort=False, observed=True, dropna=False)
+      .ngroup()
+      .to_numpy()
+  )
+  texts = logs["textPayload"].reset_index(drop=True)
+  # NA-backed strings compare to NA at the start of each track, not to True.
+  is_run_start = (
+      (texts != texts.groupby(tracks).shift()).fillna(True).to_numpy(dtype=bool)
+  )
+  run_numbers = pd.Series(is_run_start).groupby(tracks).cumsum().to_numpy()
+  runs, _ = pd.factorize(tracks.astype(np.int64) * len(logs) + run_numbers)
+  run_sizes = np.bincount(runs)[runs]
+  positions = pd.Series(np.arange(len(logs)))
+  ranks = positions.groupby(runs).cumcount().to_numpy()
+  last_positions = positions.groupby(runs).max().to_numpy()[runs]
+
+  keep = is_run_start
+  if max_samples > 0:
+    keep = keep | _get_sample_mask(ranks, run_sizes, max_samples)
+
+  is_collapsed = is_run_start & (run_sizes > 1)
+  repeat_counts = pd.array(run_sizes, dtype="Int64")
+  repeat_counts[~is_collapsed] = pd.NA
+  last_timestamps = np.full(len(logs), None, dtype=object)
+  last_timestamps[is_collapsed] = logs["timestamp"].to_numpy()[
+      last_positions[is_collapsed]
+  ]
+  collapsed = logs[keep].assign(
+      repeat_count=repeat_counts[keep],
+      last_timestamp=last_timestamps[keep],
+  )
+  logger.info(
+      "Collapsed %d repeated logs into %d slices.",
+      int((run_sizes > 1).sum()),
+      int(is_collapsed.sum()),
+  )
+  return collapsed
+
+
+def _is_worker_parent(parent) -> bool:
+  return parent == constants.COORDINATOR_GROUP or (
+      isinstance(parent, str)
+      and parent.startswith(constants.WORKER_GROUP_PREFIX)
+  )
+
+
+def _get_cluster_starts(
+    keys: np.ndarray, times: np.ndarray, tolerance: int
+) -> np.ndarray:
+  """Splits logs sorted by key and time into clusters within the tolerance.
+
+  A cluster starts at its earliest log and holds the logs with the same key up
+  to `tolerance` later.
+
+  Args:
+      keys (np.ndarray): Sorted key of each log
+      times (np.ndarray): Time of each log, sorted within each key
+      tolerance (int): Maximum time difference to the start of the cluster
+
+  Returns:
+      np.ndarray: Whether each log starts a cluster
+  """
+  # Gaps larger than the tolerance always start a new cluster. Only the chains
+  # of logs that span more than the tolerance need to be split further.
+  starts = np.ones(len(keys), dtype=bool)
+  starts[1:] = (keys[1:] != keys[:-1]) | (np.diff(times) > tolerance)
+  chain_starts = np.flatnonzero(starts)
+  chain_ends = np.append(chain_starts[1:], len(keys))
+  chain_spans = times[chain_ends - 1] - times[chain_starts]
+  for begin, end in zip(
+      chain_starts[chain_spans > tolerance], chain_ends[chain_spans > tolerance]
+  ):
+    position = begin
+    while position < end:
+      starts[position] = True
+      position = begin + np.searchsorted(
+          times[begin:end], times[position] + tolerance, side="right"
+      )
+  return starts
+
+
+def fold_workers(logs: pd.DataFrame, tolerance: float) -> pd.DataFrame:
+  """Folds the logs that all McJAX workers log at about the same time.
+
+  The logs of the Coordinator and the Slice-Worker groups with the same
+  section and text are clustered, each cluster spanning at most `tolerance`
+  seconds from its earliest log. A cluster of logs from more than one distinct
+  worker is replaced with its earliest log, moved to the "All workers" group.
+  It is annotated with the distinct groups of the folded logs in time order
+  ("workers"), their number ("num_workers") and the time between the first and
+  the last log ("timestamp_spread_ms"). Logs too far from the others, e.g. of
+  stragglers, stay on their own worker. Logs are not folded across chunks.
+
+  Args:
+      logs (pd.DataFrame): Parsed logs
+      tolerance (float): Maximum time spread of the folded logs, in seconds
+
+  Returns:
+      pd.DataFrame: Logs with the logs of the workers folded
+  """
+  parents = logs["parent"]
+  worker_parents = [p for p in parents.unique() if _is_worker_parent(p)]
+  positions = np.flatnonzero(parents.isin(worker_parents).to_numpy())
+  if len(positions) < 2:
+    return logs
+  candidates = logs.iloc[positions]
+  keys = (
+      candidates.groupby(
+          ["section", "textPayload"], sort=False, observed=True, dropna=False
+      )
+      .ngroup()
+      .to_numpy()
+  )
+  times = (
+      pd.to_datetime(candidates["timestamp"], utc=True, format="ISO8601")
+      .dt.as_unit("us")
+      .astype("int64")
+      .to_numpy()
+  )
+  order = np.lexsort((times, keys))
+  positions, keys, times = positions[order], keys[order], times[order]
+  starts = _get_cluster_starts(keys, times, int(tolerance * 1_000_000))
+
+  clusters = np.cumsum(starts) - 1
+  sizes = np.bincount(clusters)
+  # A worker can log the same text more than once within the tolerance, so
+  # the clusters are folded by their number of distinct workers.
+  parent_codes = pd.factorize(parents.iloc[positions].astype(str))[0]
+  cluster_workers = clusters * (parent_codes.max() + 1) + parent_codes
+  is_first_of_worker = np.zeros(len(positions), dtype=bool)
+  is_first_of_worker[np.unique(cluster_workers, return_index=True)[1]] = True
+  num_distinct = np.bincount(
+      clusters[is_first_of_worker], minlength=len(sizes)
+  )
+  is_folded = num_distinct[clusters] > 1
+  cluster_starts = np.flatnonzero(starts & is_folded)
+  cluster_ends = cluster_starts + sizes[clusters[cluster_starts]] - 1
+  folded_parents = (
+      parents.iloc[positions[is_folded & is_first_of_worker]]
+      .astype(str)
+      .groupby(clusters[is_folded & is_first_of_worker], sort=True)
+      .agg(", ".join)
+  )
+
+  folded = np.zeros(len(logs), dtype=bool)
+  folded[positions[cluster_starts]] = True
+  dropped = np.zeros(len(logs), dtype=bool)
+  dropped[positions[is_folded & ~starts]] = True
+  workers = np.full(len(logs), None, dtype=object)
+  workers[positions[cluster_starts]] = folded_parents.to_numpy()
+  counts = np.zeros(len(logs), dtype=np.int64)
+  counts[positions[cluster_starts]] = num_distinct[clusters[cluster_starts]]
+  num_workers = pd.array(counts, dtype="Int64")
+  num_workers[~folded] = pd.NA
+  spreads = np.full(len(logs), np.nan)
+  spreads[positions[cluster_starts]] = (
+      times[cluster_ends] - times[cluster_starts]
+  ) / 1000
+
+  reduced = logs.assign(
+      parent=categorical_utils.set_where(
+          parents, folded, constants.ALL_WORKERS_GROUP
+      ),
+      workers=workers,
+      num_workers=num_workers,
+      timestamp_spread_ms=spreads,
+  )
+  for column in WORKER_COLUMNS:
+    if column in reduced.columns:
+      reduced[column] = reduced[column].where(~folded)
+  logger.info(
+      "Folded %d logs of the workers into %d logs.",
+      int(is_folded.sum()),
+      len(cluster_starts),
+  )
+  return reduced[~dropped]
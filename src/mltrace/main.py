@@ -14,11 +14,22 @@
 
 """Main function body for mltrace.
 """
+import concurrent.futures
+import contextlib
+import itertools
 import logging
+from typing import Optional
 
+import pandas as pd
+
+from mltrace import categorical_utils
 from mltrace import log_parser
+from mltrace import log_reducer
 from mltrace import option_parser
 from mltrace import perfetto_trace_utils
+from mltrace import rules
+from mltrace import topology
+from mltrace.log_reader import async_cloud_logging_log_reader
 from mltrace.log_reader import cloud_logging_log_reader, file_log_reader
 
 logger = logging.getLogger(__name__)
@@ -27,29 +38,296 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
 
+# Rules of the worker processes of `read_and_parse_in_parallel`, set once by
+# `_init_worker`.
+_worker_rule_set = None
+
 
-def get_logs(args):
+def get_log_readers(args, rule_set: rules.RuleSet):
+  """Returns one reader per input file, or the Cloud Logging reader."""
   if args.filename:
-    return file_log_reader.FileLogReader(args.filename).read_logs()
+    if args.has_time_range:
+      return [
+          file_log_reader.FileLogReader(filename, args.start, args.end)
+          for filename in args.filename
+      ]
+    return [
+        file_log_reader.FileLogReader(filename) for filename in args.filename
+    ]
+  elif args.async_fetch:
+    return [
+        async_cloud_logging_log_reader.AsyncCloudLoggingLogReader(
+            args.project_id,
+            args.jobname,
+            args.start,
+            args.end,
+            args.log_filter,
+            rule_set=rule_set,
+        )
+    ]
   else:
-    return cloud_logging_log_reader.CloudLoggingLogReader(
-        args.project_id, args.jobname, args.start, args.end, args.log_filter
-    ).read_logs()
+    return [
+        cloud_logging_log_reader.CloudLoggingLogReader(
+            args.project_id,
+            args.jobname,
+            args.start,
+            args.end,
+            args.log_filter,
+            num_shards=args.num_shards,
+            num_workers=args.num_workers,
+            cache_dir=args.cache_dir,
+            work_dir=args.work_dir,
+            resume=args.resume,
+            rule_set=rule_set,
+        )
+    ]
+
+
+def get_partitioned_parser(args, rule_set: rules.RuleSet):
+  """Returns the parser that parses in worker processes, if requested."""
+  if args.parse_workers is None:
+    return contextlib.nullcontext()
+  return log_parser.PartitionedParser(
+      rule_set, args.engine, args.parse_workers
+  )
+
+
+def reduce_logs(args, data: pd.DataFrame) -> pd.DataFrame:
+  """Applies the optional reductions of the parsed logs.
+
+  Args:
+    args: The command-line arguments.
+    data: The parsed logs.
+
+  Returns:
+    The reduced logs.
+  """
+  if args.fold_workers is not None:
+    data = log_reducer.fold_workers(data, args.fold_workers)
+  if args.collapse_repeats:
+    data = log_reducer.collapse_repeats(data, args.max_repeat_samples)
+  return data
+
+
+def read_and_parse(
+    reader,
+    jobname: str,
+    rule_set: rules.RuleSet,
+    engine: str,
+    partitioned_parser: Optional[log_parser.PartitionedParser] = None,
+) -> tuple[int, pd.DataFrame]:
+  """Reads and parses the logs of a single reader.
+
+  Args:
+    reader: The log reader.
+    jobname: Name of the job/jobset.
+    rule_set: Rules of the redundant logs and the sections.
+    engine: Engine of the log parser.
+    partitioned_parser: Optional parser that parses in worker processes.
+
+  Returns:
+    The number of logs read and the parsed logs.
+  """
+  logs = reader.read_logs()
+  if len(logs) == 0:
+    return 0, logs
+  data = log_parser.parse_logs(
+      logs,
+      jobname,
+      rule_set=rule_set,
+      engine=engine,
+      partitioned_parser=partitioned_parser,
+  )
+  return len(logs), reader.add_derived_columns(data)
+
+
+def _init_worker(rule_set: rules.RuleSet):
+  global _worker_rule_set
+  _worker_rule_set = rule_set
+
+
+def _read_and_parse_in_worker(
+    reader, jobname: str, engine: str
+) -> tuple[int, pd.DataFrame]:
+  return read_and_parse(reader, jobname, _worker_rule_set, engine)
+
+
+def read_and_parse_in_parallel(
+    readers,
+    jobname: str,
+    rule_set: rules.RuleSet,
+    engine: str,
+    num_workers: Optional[int],
+) -> tuple[int, pd.DataFrame]:
+  """Reads and parses the logs of multiple readers in a process pool.
+
+  Args:
+    readers: The log readers.
+    jobname: Name of the job/jobset.
+    rule_set: Rules of the redundant logs and the sections.
+    engine: Engine of the log parser.
+    num_workers: Maximum number of worker processes.
+
+  Returns:
+    The total number of logs read and the merged parsed logs.
+  """
+  logger.info(
+      "Parsing %d files with up to %s worker processes.",
+      len(readers),
+      num_workers or "cpu_count",
+  )
+  # The rule set is sent once per worker, not once per reader.
+  with concurrent.futures.ProcessPoolExecutor(
+      max_workers=num_workers,
+      initializer=_init_worker,
+      initargs=(rule_set,),
+  ) as executor:
+    results = list(
+        executor.map(
+            _read_and_parse_in_worker,
+            readers,
+            itertools.repeat(jobname),
+            itertools.repeat(engine),
+        )
+    )
+  num_logs = sum(n for n, _ in results)
+  frames = [data for _, data in results if len(data)]
+  if not frames:
+    return num_logs, pd.DataFrame()
+  return num_logs, categorical_utils.concat_logs(frames)
+
+
+def run_in_chunks(
+    args,
+    rule_set: rules.RuleSet,
+    partitioned_parser: Optional[log_parser.PartitionedParser] = None,
+):
+  """Reads, parses and translates the logs one chunk at a time.
+
+  Each chunk is appended to the trace file as soon as it is translated, so
+  only one chunk of logs is held in memory at a time.
+
+  Args:
+    args: The command-line arguments.
+    rule_set: Rules of the redundant logs and the sections.
+    partitioned_parser: Optional parser that parses in worker processes.
+  """
+  builder = perfetto_trace_utils.get_trace_builder(
+      not args.no_interning, fast_encoder=args.fast_encoder
+  )
+  perfetto_trace_utils.dump_traces(args.output_filename, builder.flush())
+  topology_resolver = topology.TopologyResolver(args.jobname)
+  num_logs = 0
+  num_parsed_logs = 0
+  for reader in get_log_readers(args, rule_set):
+    for logs in reader.read_logs_in_chunks(args.chunksize):
+      num_logs += len(logs)
+      if len(logs) == 0:
+        continue
+      data = log_parser.parse_logs(
+          logs,
+          args.jobname,
+          topology_resolver,
+          rule_set,
+          args.engine,
+          partitioned_parser,
+      )
+      num_parsed_logs += len(data)
+      if len(data) == 0:
+        continue
+      data = reduce_logs(args, data)
+      builder.add_logs(reader.add_derived_columns(data))
+      perfetto_trace_utils.append_traces(
+          args.output_filename, builder.flush()
+      )
+  logger.info("Number of logs read: %d", num_logs)
+  if num_logs == 0:
+    raise ValueError("No logs found!")
+  logger.info("Number of logs after parsing: %d", num_parsed_logs)
+  if num_parsed_logs == 0:
+    raise ValueError(
+        "We could not parse any logs while the file was not empty."
+        " Check the format of the logs."
+    )
+
+
+def run_follow(
+    args,
+    rule_set: rules.RuleSet,
+    partitioned_parser: Optional[log_parser.PartitionedParser] = None,
+):
+  """Tails Cloud Logging and appends the new logs to the trace file.
+
+  Only the new logs are parsed and translated at each flush. The trace builder
+  keeps the tracks of the previous flushes, so the appended packets extend the
+  same trace.
+
+  Args:
+    args: The command-line arguments.
+    rule_set: Rules of the redundant logs and the sections.
+    partitioned_parser: Optional parser that parses in worker processes.
+  """
+  reader = get_log_readers(args, rule_set)[0]
+  builder = perfetto_trace_utils.get_trace_builder(
+      not args.no_interning, fast_encoder=args.fast_encoder
+  )
+  perfetto_trace_utils.dump_traces(args.output_filename, builder.flush())
+  topology_resolver = topology.TopologyResolver(args.jobname)
+  try:
+    for logs in reader.follow_logs(args.flush_interval):
+      data = log_parser.parse_logs(
+          logs,
+          args.jobname,
+          topology_resolver,
+          rule_set,
+          args.engine,
+          partitioned_parser,
+      )
+      logger.info(
+          "Read %d new logs, %d after parsing.", len(logs), len(data)
+      )
+      if len(data) == 0:
+        continue
+      data = reduce_logs(args, data)
+      builder.add_logs(reader.add_derived_columns(data))
+      perfetto_trace_utils.append_traces(args.output_filename, builder.flush())
+  except KeyboardInterrupt:
+    logger.info("Stopped following the logs.")
 
 
 def main():
   """Script main entry."""
   args = option_parser.getopts()
-  logs = get_logs(args)
-  logger.info("Number of logs read: %d", len(logs))
-  if len(logs) == 0:
+  rule_set = rules.load_rule_set(args.rules)
+  with get_partitioned_parser(args, rule_set) as partitioned_parser:
+    if args.follow:
+      run_follow(args, rule_set, partitioned_parser)
+      return
+    if args.chunksize or args.async_fetch:
+      run_in_chunks(args, rule_set, partitioned_parser)
+      return
+    readers = get_log_readers(args, rule_set)
+    if len(readers) > 1:
+      num_logs, data = read_and_parse_in_parallel(
+          readers, args.jobname, rule_set, args.engine, args.num_workers
+      )
+    else:
+      num_logs, data = read_and_parse(
+          readers[0], args.jobname, rule_set, args.engine, partitioned_parser
+      )
+  logger.info("Number of logs read: %d", num_logs)
+  if num_logs == 0:
     raise ValueError("No logs found!")
-  data = log_parser.parse_logs(logs, args.jobname)
   logger.info("Number of logs after parsing: %d", len(data))
   if len(data) == 0:
     raise ValueError(
         "We could not parse any logs while the file was not empty."
         " Check the format of the logs."
     )
-  traces = perfetto_trace_utils.translate_to_traces(data)
-  perfetto_trace_utils.dump_traces(args.output_filename, traces)
+  data = reduce_logs(args, data)
+  perfetto_trace_utils.write_traces(
+      args.output_filename,
+      data,
+      intern_strings=not args.no_interning,
+      fast_encoder=args.fast_encoder,
+  )
@@ -0,0 +1,426 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Matchers that check texts against many patterns in a single pass.
+"""
+
+import logging
+import re
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+  from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+  import sre_parse  # pylint: disable=deprecated-module
+
+try:
+  import ahocorasick
+except ImportError:
+  ahocorasick = None
+
+try:
+  import pyarrow as pa
+  from pyarrow import compute as pa_compute
+except ImportError:
+  pa = None
+  pa_compute = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_required_literal(pattern: str) -> tuple[bool, str]:
+  """Returns the longest literal contained in every match of the pattern.
+
+  Only the top-level sequence of the pattern is inspected: any construct other
+  than a plain character (a class, a group, a repeat, an anchor, ...) ends the
+  current run of literal characters.
+
+  Args:
+    pattern (str): Regular expression
+
+  Returns:
+    tuple[bool, str]: Whether the pattern is a plain literal, and the longest
+    required literal (empty if there is none)
+  """
+  is_literal = True
+  longest = ""
+  run = ""
+  for op, av in sre_parse.parse(pattern):
+    if op is sre_parse.LITERAL:
+      run += chr(av)
+      continue
+    is_literal = False
+    longest = max(longest, run, key=len)
+    run = ""
+  return is_literal, max(longest, run, key=len)
+
+
+class PatternMatcher:
+  """Searches texts for any of the given regex patterns.
+
+  The patterns are compiled once. Plain literal patterns are matched with a
+  multi-pattern automaton (Aho-Corasick, if `pyahocorasick` is installed) in a
+  single pass over the text. Each genuine regex pattern is only searched for
+  once the text is known to contain a literal that every match of the pattern
+  contains. A text matches if any of the patterns is found in it, as with
+  `re.search` on the alternation of the patterns.
+  """
+
+  def __init__(self, patterns: list[str]):
+    self._literals = set()
+    # Required literal -> regexes that can only match if it is present.
+    self._prefiltered_regexes = {}
+    # Regexes without a required literal, searched in every text.
+    self._regexes = []
+    for pattern in patterns:
+      is_literal, literal = get_required_literal(pattern)
+      if is_literal and literal:
+        self._literals.add(literal)
+      elif literal:
+        self._prefiltered_regexes.setdefault(literal, []).append(
+            re.compile(pattern)
+        )
+      else:
+        self._regexes.append(re.compile(pattern))
+
+    self._automaton = None
+    self._literals_regex = None
+    if ahocorasick is not None:
+      self._automaton = ahocorasick.Automaton()
+      for literal in self._literals | self._prefiltered_regexes.keys():
+        self._automaton.add_word(literal, literal)
+      if len(self._automaton):
+        self._automaton.make_automaton()
+      else:
+        self._automaton = None
+    elif self._literals:
+      self._literals_regex = re.compile(
+          "|".join(re.escape(literal) for literal in self._literals)
+      )
+
+  def search(self, text: str) -> bool:
+    """Returns whether any of the patterns is found in the text.
+
+    Args:
+      text (str): Text to search
+
+    Returns:
+      bool: Whether the text matches
+    """
+    if not isinstance(text, str):
+      return False
+    if self._automaton is not None:
+      checked = set()
+      for _, literal in self._automaton.iter(text):
+        if literal in self._literals:
+          return True
+        if literal in checked:
+          continue
+        checked.add(literal)
+        for regex in self._prefiltered_regexes[literal]:
+          if regex.search(text):
+            return True
+    else:
+      if self._literals_regex is not None and self._literals_regex.search(
+          text
+      ):
+        return True
+      for literal, regexes in self._prefiltered_regexes.items():
+        if literal in text:
+          for regex in regexes:
+            if regex.search(text):
+              return True
+    return any(regex.search(text) for regex in self._regexes)
+
+  def contains(self, texts: pd.Series) -> pd.Series:
+    """Returns whether each text matches any of the patterns.
+
+    Args:
+      texts (pd.Series): Texts to search
+
+    Returns:
+      pd.Series: Boolean mask aligned with the texts
+    """
+    return pd.Series(
+        [self.search(text) for text in texts], index=texts.index, dtype=bool
+    )
+
+
+class SectionClassifier:
+  """Assigns texts the section of the last rule they match.
+
+  The rules are case-insensitive regex patterns mapped to section names, and
+  later rules take precedence over earlier ones. A single search with the
+  alternation of all the rules tells whether a text matches any rule, which
+  most texts don't. Only the texts that do are checked against the rules from
+  the last to the first, stopping at the first match.
+  """
+
+  def __init__(self, rules: dict[str, str]):
+    self._any_rule = None
+    if rules:
+      self._any_rule = re.compile(
+          "|".join(f"(?:{pattern})" for pattern in rules), re.IGNORECASE
+      )
+    self._rules = [
+        (re.compile(pattern, re.IGNORECASE), section)
+        for pattern, section in reversed(rules.items())
+    ]
+
+  def classify(self, text: str) -> Optional[str]:
+    """Returns the section of the last rule the text matches.
+
+    Args:
+      text (str): Text to classify
+
+    Returns:
+      str: Section name, or None if the text matches no rule
+    """
+    if (
+        not isinstance(text, str)
+        or self._any_rule is None
+        or not self._any_rule.search(text)
+    ):
+      return None
+    for regex, section in self._rules:
+      if regex.search(text):
+        return section
+    return None
+
+  def classify_all(self, texts: pd.Series) -> pd.Series:
+    """Returns the section of the last rule each text matches.
+
+    Args:
+      texts (pd.Series): Texts to classify
+
+    Returns:
+      pd.Series: Section names aligned with the texts, None where no rule
+      matches
+    """
+    return pd.Series(
+        [self.classify(text) for text in texts], index=texts.index, dtype=object
+    )
+
+
+def _count_end_anchors(parsed) -> int:
+  """Counts the `$` anchors anywhere in a parsed pattern."""
+  count = 0
+  for item in parsed:
+    if isinstance(item, (sre_parse.SubPattern, list, tuple)):
+      count += _count_end_anchors(item)
+    elif item is sre_parse.AT_END:
+      count += 1
+  return count
+
+
+def to_re2(pattern: str) -> Optional[str]:
+  """Translates a Python regex to an equivalent RE2 regex for Arrow kernels.
+
+  `$` also matches before a trailing newline in Python, so a final `$` is
+  translated to `\\n?\\z`. Patterns that RE2 can't compile, e.g. with
+  lookarounds or backreferences, or with `$` elsewhere, are not translated.
+  Note that `\\d`, `\\w` and `\\s` only match ASCII characters in RE2.
+
+  Args:
+    pattern (str): Python regular expression
+
+  Returns:
+    str: RE2 regular expression, or None if there is no equivalent
+  """
+  num_end_anchors = _count_end_anchors(sre_parse.parse(pattern))
+  if num_end_anchors:
+    parsed = sre_parse.parse(pattern)
+    if (
+        num_end_anchors > 1
+        or not pattern.endswith("$")
+        or parsed[-1] != (sre_parse.AT, sre_parse.AT_END)
+    ):
+      return None
+    pattern = pattern[:-1] + r"\n?\z"
+  try:
+    pa_compute.match_substring_regex(pa.array([""]), pattern)
+  except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+    return None
+  return pattern
+
+
+def to_arrow_strings(texts: pd.Series) -> "pa.Array":
+  """Converts texts to an Arrow string array, zero-copy if Arrow-backed.
+
+  Args:
+    texts (pd.Series): Texts, None/NaN for missing ones
+
+  Returns:
+    pa.Array: Arrow string array with nulls for the missing texts
+  """
+  array = pa.array(texts, from_pandas=True)
+  if isinstance(array, pa.ChunkedArray):
+    array = array.combine_chunks()
+  if not (pa.types.is_string(array.type) or pa.types.is_large_string(
+      array.type
+  )):
+    array = array.cast(pa.string())
+  return array
+
+
+def is_arrow_backed(texts: pd.Series) -> bool:
+  """Returns whether the texts are stored in Arrow, e.g. pandas' "str" dtype.
+
+  Args:
+    texts (pd.Series): Texts
+
+  Returns:
+    bool: Whether the Arrow kernels can search the texts without a copy
+  """
+  dtype = texts.dtype
+  return pa is not None and (
+      isinstance(dtype, pd.ArrowDtype)
+      or (isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow")
+  )
+
+
+def _escape_re2(literal: str) -> str:
+  """Escapes a literal for RE2."""
+  escaped = []
+  for c in literal:
+    if c.isalnum() or c in "_ ":
+      escaped.append(c)
+    elif c.isascii() and c.isprintable():
+      escaped.append("\\" + c)
+    else:
+      escaped.append(f"\\x{{{ord(c):x}}}")
+  return "".join(escaped)
+
+
+def _search(
+    texts: "pa.Array", regex: Optional[str], ignore_case: bool = False
+) -> np.ndarray:
+  """Returns whether the RE2 regex is found in each text."""
+  if not regex:
+    return np.zeros(len(texts), dtype=bool)
+  return (
+      pa_compute.match_substring_regex(texts, regex, ignore_case=ignore_case)
+      .fill_null(False)
+      .to_numpy(zero_copy_only=False)
+  )
+
+
+class ArrowPatternMatcher:
+  """Searches texts for any of the given regex patterns with Arrow kernels.
+
+  The texts are converted to an Arrow string array once and searched with
+  `pyarrow.compute.match_substring_regex` for the alternation of all the
+  patterns, in a single pass. RE2 matches large alternations without
+  backtracking, so this is faster than prefiltering the texts by literals.
+  The patterns without an RE2 equivalent are searched for in Python, in the
+  texts that don't match any other pattern.
+  """
+
+  def __init__(self, patterns: list[str]):
+    re2_patterns = []
+    python_patterns = []
+    for pattern in patterns:
+      is_literal, literal = get_required_literal(pattern)
+      if is_literal and literal:
+        re2_patterns.append(_escape_re2(literal))
+        continue
+      re2_pattern = to_re2(pattern)
+      if re2_pattern is None:
+        python_patterns.append(pattern)
+      else:
+        re2_patterns.append(re2_pattern)
+    if python_patterns:
+      logger.debug(
+          "Matching %d patterns without an RE2 equivalent in Python.",
+          len(python_patterns),
+      )
+    self._regex = "|".join(f"(?:{r})" for r in re2_patterns)
+    self._python_matcher = (
+        PatternMatcher(python_patterns) if python_patterns else None
+    )
+
+  def contains(self, texts: pd.Series) -> pd.Series:
+    """Returns whether each text matches any of the patterns.
+
+    Args:
+      texts (pd.Series): Texts to search
+
+    Returns:
+      pd.Series: Boolean mask aligned with the texts
+    """
+    mask = _search(to_arrow_strings(texts), self._regex)
+    if self._python_matcher is not None:
+      remaining = np.flatnonzero(~mask)
+      mask[remaining] = self._python_matcher.contains(
+          texts.iloc[remaining]
+      ).to_numpy()
+    return pd.Series(mask, index=texts.index, dtype=bool)
+
+
+class ArrowSectionClassifier:
+  """Assigns texts the section of the last rule they match, with Arrow kernels.
+
+  A single `pyarrow.compute.match_substring_regex` pass with the alternation
+  of all the rules selects the texts that match any rule. Only those are then
+  matched against each rule in order, later matches overriding earlier ones.
+  If a rule has no RE2 equivalent, all texts are classified by a
+  `SectionClassifier` instead.
+  """
+
+  def __init__(self, rules: dict[str, str]):
+    self._python_classifier = None
+    self._rules = []
+    for pattern, section in rules.items():
+      re2_pattern = to_re2(pattern)
+      if re2_pattern is None:
+        logger.debug(
+            "Section rule %r has no RE2 equivalent, classifying in Python.",
+            pattern,
+        )
+        self._python_classifier = SectionClassifier(rules)
+        self._rules = []
+        break
+      self._rules.append((re2_pattern, section))
+    self._any_rule = "|".join(f"(?:{pattern})" for pattern, _ in self._rules)
+
+  def classify_all(self, texts: pd.Series) -> pd.Series:
+    """Returns the section of the last rule each text matches.
+
+    Args:
+      texts (pd.Series): Texts to classify
+
+    Returns:
+      pd.Series: Section names aligned with the texts, None where no rule
+      matches
+    """
+    if self._python_classifier is not None:
+      return self._python_classifier.classify_all(texts)
+    sections = np.full(len(texts), None, dtype=object)
+    if not self._rules:
+      return pd.Series(sections, index=texts.index, dtype=object)
+    array = to_arrow_strings(texts)
+    candidates = np.flatnonzero(
+        _search(array, self._any_rule, ignore_case=True)
+    )
+    candidate_texts = array.take(pa.array(candidates))
+    candidate_sections = np.full(len(candidates), None, dtype=object)
+    for pattern, section in self._rules:
+      candidate_sections[
+          _search(candidate_texts, pattern, ignore_case=True)
+      ] = section
+    sections[candidates] = candidate_sections
+    return pd.Series(sections, index=texts.index, dtype=object)
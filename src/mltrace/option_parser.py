@@ -17,10 +17,12 @@
 
 import argparse
 import datetime
+import glob
 import logging
 import os
 
 from mltrace import constants
+from mltrace import perfetto_trace_utils
 
 
 class IllegalArgumentError(ValueError):
@@ -88,6 +90,23 @@ def validate_time(start: str, end: str):
     )
 
 
+def expand_filenames(filenames: list[str]) -> list[str]:
+  """Expands the glob patterns among the given file paths.
+
+  Args:
+    filenames: File paths or glob patterns.
+
+  Returns:
+    The file paths, with each pattern replaced by its sorted matches. Patterns
+    without matches are kept as is.
+  """
+  expanded = []
+  for filename in filenames:
+    matches = sorted(glob.glob(filename))
+    expanded.extend(matches or [filename])
+  return expanded
+
+
 def validate_args(args: argparse.Namespace):
   """Validates the command-line args.
 
@@ -102,11 +121,12 @@ def validate_args(args: argparse.Namespace):
         "Jobname cannot be empty. Provide a valid jobset/job name"
     )
   if args.filename is not None:
-    # Reading from a file.
-    if not os.path.exists(args.filename):
-      raise IllegalArgumentError(
-          f"ERROR: Provide a valid file path. `{args.filename}` does not exist!"
-      )
+    # Reading from files.
+    for filename in args.filename:
+      if not os.path.exists(filename):
+        raise IllegalArgumentError(
+            f"ERROR: Provide a valid file path. `{filename}` does not exist!"
+        )
   else:
     # Reading from Cloud Logging.
     if args.output_filename is None:
@@ -115,6 +135,101 @@ def validate_args(args: argparse.Namespace):
           " --filename.\nOtherwise if you're reading logs from Cloud Logging,"
           " provide --output_filename where the traces will be stored."
       )
+  if args.chunksize is not None and args.chunksize <= 0:
+    raise IllegalArgumentError(
+        f"ERROR: --chunksize must be a positive integer. Got {args.chunksize}"
+    )
+  if args.num_shards <= 0:
+    raise IllegalArgumentError(
+        f"ERROR: --num_shards must be a positive integer. Got {args.num_shards}"
+    )
+  if args.num_workers is not None and args.num_workers <= 0:
+    raise IllegalArgumentError(
+        "ERROR: --num_workers must be a positive integer. Got"
+        f" {args.num_workers}"
+    )
+  if args.async_fetch and (
+      args.filename is not None
+      or args.num_shards > 1
+      or args.cache_dir is not None
+      or args.work_dir is not None
+  ):
+    raise IllegalArgumentError(
+        "ERROR: --async_fetch only applies to Cloud Logging reads and cannot"
+        " be combined with --num_shards, --cache_dir, --work_dir or --resume."
+    )
+  if args.follow and (
+      args.filename is not None
+      or args.async_fetch
+      or args.num_shards > 1
+      or args.cache_dir is not None
+      or args.chunksize is not None
+      or args.work_dir is not None
+  ):
+    raise IllegalArgumentError(
+        "ERROR: --follow only applies to Cloud Logging reads and cannot be"
+        " combined with --async_fetch, --num_shards, --cache_dir, --chunksize,"
+        " --work_dir or --resume."
+    )
+  if args.flush_interval <= 0:
+    raise IllegalArgumentError(
+        "ERROR: --flush_interval must be positive. Got"
+        f" {args.flush_interval}"
+    )
+  if args.resume and args.work_dir is None:
+    raise IllegalArgumentError("ERROR: --resume requires --work_dir.")
+  if args.work_dir is not None and not args.has_fixed_time_range:
+    # The checkpoints are keyed by the time window, which would otherwise
+    # move with the time of each run.
+    raise IllegalArgumentError(
+        "ERROR: --work_dir and --resume require an explicit --start and --end."
+    )
+  if args.parse_workers is not None:
+    if args.parse_workers <= 0:
+      raise IllegalArgumentError(
+          "ERROR: --parse_workers must be a positive integer. Got"
+          f" {args.parse_workers}"
+      )
+    if args.filename is not None and len(args.filename) > 1:
+      raise IllegalArgumentError(
+          "ERROR: --parse_workers only applies to a single input. Multiple"
+          " files are already parsed in parallel, see --num_workers."
+      )
+  if args.max_repeat_samples < 0:
+    raise IllegalArgumentError(
+        "ERROR: --max_repeat_samples must be non-negative. Got"
+        f" {args.max_repeat_samples}"
+    )
+  if args.max_repeat_samples and not args.collapse_repeats:
+    raise IllegalArgumentError(
+        "ERROR: --max_repeat_samples requires --collapse_repeats."
+    )
+  if args.fold_workers is not None and args.fold_workers < 0:
+    raise IllegalArgumentError(
+        "ERROR: --fold_workers must be non-negative. Got"
+        f" {args.fold_workers}"
+    )
+  if args.filename is not None:
+    # The output files are derived from the first input by default, e.g.
+    # `logs.gz` for `logs.jsonl`. Never let them overwrite an input.
+    output_filepaths = {
+        os.path.realpath(get_output_filepath(args.output_filename))
+        for get_output_filepath in (
+            perfetto_trace_utils.get_trace_filepath,
+            perfetto_trace_utils.get_html_filepath,
+        )
+    }
+    for filename in args.filename:
+      if os.path.realpath(filename) in output_filepaths:
+        raise IllegalArgumentError(
+            f"ERROR: The output would overwrite the input file `{filename}`."
+            " Pass another output name with -o."
+        )
+  for rules_filename in args.rules or []:
+    if not os.path.exists(rules_filename):
+      raise IllegalArgumentError(
+          f"ERROR: Rule pack `{rules_filename}` does not exist!"
+      )
   validate_time(args.start, args.end)
 
 
@@ -128,7 +243,13 @@ def getopts() -> argparse.Namespace:
       prog="MLTrace", description="Build traces for the GCP workload logs"
   )
   parser.add_argument(
-      "-f", "--filename", help="Path to the CSV/JSON file that contains logs"
+      "-f",
+      "--filename",
+      nargs="+",
+      help=(
+          "Paths or glob patterns of the CSV/JSON/Parquet/Arrow files that"
+          " contain logs. Multiple files are parsed in parallel"
+      ),
   )
   parser.add_argument("-j", "--jobname", help="Name of the job/jobset")
   parser.add_argument(
@@ -141,7 +262,10 @@ def getopts() -> argparse.Namespace:
       "-s",
       "--start",
       default=None,
-      help="Start time of logs, defaults to 1 hour before end time",
+      help=(
+          "Start time of logs, defaults to 1 hour before end time. Parquet and"
+          " Arrow files are only filtered by time if --start or --end is set"
+      ),
   )
   parser.add_argument(
       "-l",
@@ -156,6 +280,158 @@ def getopts() -> argparse.Namespace:
       "--output_filename",
       help="Name of the output file when reading directly from Cloud Logging",
   )
+  parser.add_argument(
+      "--chunksize",
+      type=int,
+      default=None,
+      help=(
+          "Number of records to read, parse and translate at a time. Bounds"
+          " the memory usage for large log files. Reads the whole file at"
+          " once if not set."
+      ),
+  )
+  parser.add_argument(
+      "--num_shards",
+      type=int,
+      default=1,
+      help=(
+          "Number of sub-windows the time window is split into when reading"
+          " from Cloud Logging. The sub-windows are fetched concurrently."
+      ),
+  )
+  parser.add_argument(
+      "--num_workers",
+      type=int,
+      default=None,
+      help=(
+          "Maximum number of concurrent workers for fetching time shards and"
+          " parsing multiple files"
+      ),
+  )
+  parser.add_argument(
+      "--cache_dir",
+      default=None,
+      help=(
+          "Directory where the logs read from Cloud Logging are cached. Reruns"
+          " of the same query only fetch the parts of the time window that"
+          " are not cached yet"
+      ),
+  )
+  parser.add_argument(
+      "--async_fetch",
+      action="store_true",
+      help=(
+          "Fetch the pages from Cloud Logging asynchronously and parse each"
+          " page while the next ones are in flight. --chunksize sets the page"
+          " size"
+      ),
+  )
+  parser.add_argument(
+      "--follow",
+      action="store_true",
+      help=(
+          "Keep tailing Cloud Logging from the start time and append the new"
+          " logs to the trace file every --flush_interval seconds, until"
+          " interrupted"
+      ),
+  )
+  parser.add_argument(
+      "--flush_interval",
+      type=float,
+      default=30,
+      help="Seconds between two appends to the trace file with --follow",
+  )
+  parser.add_argument(
+      "--work_dir",
+      default=None,
+      help=(
+          "Directory where every page read from Cloud Logging is"
+          " checkpointed, so that an interrupted read can be resumed"
+      ),
+  )
+  parser.add_argument(
+      "--resume",
+      action="store_true",
+      help=(
+          "Resume an interrupted Cloud Logging read from the checkpoints in"
+          " --work_dir. Pass the same arguments as the interrupted run,"
+          " including --start and --end"
+      ),
+  )
+  parser.add_argument(
+      "--rules",
+      nargs="+",
+      default=None,
+      help=(
+          "Paths to JSON rule packs with extra redundant logs and section"
+          " rules, merged with the built-in rules in order. See the README"
+      ),
+  )
+  parser.add_argument(
+      "--engine",
+      default="python",
+      choices=constants.PARSER_ENGINES,
+      help=(
+          "Engine of the log parser. pyarrow runs the filter and section"
+          " stages with Arrow compute kernels, which is faster on large logs"
+          " and requires `pip install pyarrow`. Logs read as Arrow-backed"
+          " strings are matched with Arrow kernels with either engine"
+      ),
+  )
+  parser.add_argument(
+      "--parse_workers",
+      type=int,
+      default=None,
+      help=(
+          "Number of worker processes that filter and section the logs in"
+          " parallel, for large inputs. Requires `pip install pyarrow`"
+      ),
+  )
+  parser.add_argument(
+      "--collapse_repeats",
+      action="store_true",
+      help=(
+          "Collapse consecutive identical logs of the same track into one"
+          " slice annotated with the number of logs"
+      ),
+  )
+  parser.add_argument(
+      "--max_repeat_samples",
+      type=int,
+      default=0,
+      help=(
+          "Number of logs of each collapsed run that are also kept as"
+          " instant events, evenly spaced over the run"
+      ),
+  )
+  parser.add_argument(
+      "--fold_workers",
+      type=float,
+      default=None,
+      metavar="TOLERANCE",
+      help=(
+          "Fold the identical logs that the McJAX workers log within"
+          " TOLERANCE seconds of each other into one log of an"
+          " `All workers` group"
+      ),
+  )
+  parser.add_argument(
+      "--no_interning",
+      action="store_true",
+      help=(
+          "Write the event names and the debug annotations of every event in"
+          " full instead of interning the repeated strings, for trace"
+          " consumers that don't support interning"
+      ),
+  )
+  parser.add_argument(
+      "--fast_encoder",
+      action="store_true",
+      help=(
+          "Encode the trace packets to bytes directly instead of building"
+          " protobuf messages, which is faster on large traces"
+      ),
+  )
   parser.add_argument("--loglevel", default="INFO",
                       choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
                       help="Set the logging level (e.g., DEBUG, INFO, WARNING)")
@@ -163,12 +439,19 @@ def getopts() -> argparse.Namespace:
 
   set_logging_level(args.loglevel)
 
+  # Files are only filtered by time if a time window was given explicitly.
+  args.has_time_range = args.start is not None or args.end is not None
+  args.has_fixed_time_range = args.start is not None and args.end is not None
+
   # Set start and end times if missing, so that the tool doesn't run without
   # bounds.
   args.start, args.end = get_default_time_range(args.start, args.end)
 
+  if args.filename is not None:
+    args.filename = expand_filenames(args.filename)
+
   if args.output_filename is None and args.filename is not None:
-    args.output_filename = args.filename
+    args.output_filename = args.filename[0]
 
   validate_args(args)
   return args
@@ -15,21 +15,122 @@
 """Translates logs to Perfetto trace events and dumps the traces to a .gz file.
 """
 
-import datetime
 import gzip
 import logging
-import os
 import pathlib
-import re
 import string
+from typing import Optional
 
 from mltrace import constants
+from mltrace import trace_encoder
+import numpy as np
 import pandas as pd
 from perfetto.protos.perfetto.trace import perfetto_trace_pb2
 
 logger = logging.getLogger(__name__)
 
 
+def get_timestamps_us(timestamps: pd.Series) -> np.ndarray:
+  """Returns the timestamps of the logs in microseconds since the epoch.
+
+  ISO 8601 strings are truncated to whole microseconds, while datetime objects
+  are rounded to 6 decimals of seconds like `pd.Timestamp.timestamp`. Both go
+  through float seconds before being truncated to an integer, so a result can
+  be one microsecond below the exact value.
+
+  Args:
+    timestamps (pd.Series): ISO 8601 strings or datetime objects
+
+  Returns:
+    np.ndarray: Microseconds since the epoch
+  """
+  if len(timestamps) == 0:
+    return np.zeros(0, dtype=np.int64)
+  nanoseconds = (
+      pd.to_datetime(timestamps, utc=True, format="ISO8601")
+      .dt.as_unit("ns")
+      .astype("int64")
+      .to_numpy()
+  )
+  if isinstance(timestamps.iloc[0], str):
+    return (nanoseconds // 1000 / 1_000_000 * 1_000_000).astype(np.int64)
+  return np.array(
+      [
+          int(round(ns / 1_000_000_000, 6) * 1_000_000)
+          for ns in nanoseconds.tolist()
+      ],
+      dtype=np.int64,
+  )
+
+
+def _to_strings(column: pd.Series) -> list:
+  """Returns the values of a column as strings, with None for null values.
+
+  Args:
+    column (pd.Series): Column of the logs
+
+  Returns:
+    list: The string of each value
+  """
+  if isinstance(column.dtype, pd.CategoricalDtype):
+    # Null values have the code -1, which picks the trailing None.
+    categories = [str(c) for c in column.cat.categories] + [None]
+    return [categories[code] for code in column.cat.codes.tolist()]
+  is_null = column.isna().to_numpy().tolist()
+  return [
+      None if null else str(value)
+      for value, null in zip(column.to_numpy(dtype=object).tolist(), is_null)
+  ]
+
+
+def sort_by_track(df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+  """Sorts the logs by their parent/section track in a single sort.
+
+  The parents come in the order of their first log, and so do the sections of
+  each parent. The logs of each track keep their order.
+
+  Args:
+    df (pd.DataFrame): Logs data
+
+  Returns:
+    tuple[pd.DataFrame, np.ndarray]: The sorted logs, and the start of each
+    track in them followed by their length
+  """
+  parent_codes, _ = pd.factorize(df["parent"], use_na_sentinel=False)
+  track_codes = (
+      df.groupby(["parent", "section"], sort=False, observed=True, dropna=False)
+      .ngroup()
+      .to_numpy()
+  )
+  # The track numbers follow the first logs of the tracks, so sorting by them
+  # within each parent orders the sections of the parent by their first log.
+  order = np.lexsort((track_codes, parent_codes))
+  sorted_tracks = track_codes[order]
+  bounds = np.flatnonzero(np.diff(sorted_tracks)) + 1
+  return df.take(order), np.concatenate(([0], bounds, [len(df)]))
+
+
+def _has_repeats(values: list, track_numbers: np.ndarray) -> np.ndarray:
+  """Returns whether each track has a value more than once.
+
+  Args:
+    values (list): Values of the logs, sorted by track
+    track_numbers (np.ndarray): Track of each log, sorted
+
+  Returns:
+    np.ndarray: Whether each track repeats a value
+  """
+  codes, uniques = pd.factorize(
+      np.array(values, dtype=object), use_na_sentinel=False
+  )
+  keys = track_numbers * max(len(uniques), 1) + codes
+  num_tracks = int(track_numbers[-1]) + 1
+  num_distinct = np.bincount(
+      np.unique(keys) // max(len(uniques), 1), minlength=num_tracks
+  )
+  return num_distinct < np.bincount(track_numbers, minlength=num_tracks)
+
+
 class Counter:
   """A simple counter that returns the next counter value."""
 
@@ -41,7 +142,520 @@ class Counter:
     return self._counter
 
 
-def translate_to_traces(df: pd.DataFrame) -> bytes:
+class TraceWriter:
+  """Streams trace packets to the .gz trace file.
+
+  A serialized `Trace` is the concatenation of its packets, each encoded as a
+  length-delimited field 1. The packets are encoded this way one at a time and
+  compressed as they're written, so neither the whole trace nor its serialized
+  bytes are held in memory.
+  """
+
+  def __init__(self, input_filepath: str, append: bool = False):
+    """Opens the trace file.
+
+    Args:
+      input_filepath (str): The path to the input file
+      append (bool): Whether to append to the trace file as a new gzip member
+        instead of overwriting it
+    """
+    self.filepath = get_trace_filepath(input_filepath)
+    logger.debug("Streaming the traces to %s", self.filepath)
+    self._file = gzip.open(self.filepath, "ab" if append else "wb")
+
+  def write_packet(self, packet: perfetto_trace_pb2.TracePacket):
+    """Writes a packet to the trace file.
+
+    Args:
+      packet (perfetto_trace_pb2.TracePacket): The packet
+    """
+    self._file.write(trace_encoder.frame_packet(packet.SerializeToString()))
+
+  def write_encoded_packet(self, data: bytes):
+    """Writes a packet encoded by `trace_encoder.encode_packet`.
+
+    Args:
+      data (bytes): The framed packet
+    """
+    self._file.write(data)
+
+  def close(self):
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+class TraceBuilder:
+  """Incrementally translates logs to trace packets.
+
+  Tracks are created the first time their parent/section shows up and are
+  reused afterwards, and the clock snapshot is only emitted once. Logs can
+  therefore be added chunk by chunk, with `flush()` returning the packets built
+  since the previous flush. Serialized `Trace` messages concatenate into a
+  valid trace, so the flushed outputs can be appended to the same file.
+
+  If a `writer` is given, each packet is written to it as soon as the next one
+  is started, so that only one packet is held in memory, and `flush()` writes
+  the last packet.
+
+  Unless `intern_strings` is False, the event names, the debug annotation
+  names and the repeated debug annotation values are interned: each string is
+  emitted once in the `interned_data` of the first packet that uses it, and
+  referenced by its iid afterwards. The interned strings are part of the
+  incremental state of the packet sequence, so they carry over between
+  flushes.
+  """
+
+  def __init__(
+      self,
+      intern_strings: bool = True,
+      writer: Optional["TraceWriter"] = None,
+  ):
+    self._counter = Counter()
+    self._writer = writer
+    self._clock_is_set = False
+    self._parent_uuids = {}
+    self._section_uuids = {}
+    self._intern_strings = intern_strings
+    self._event_name_iids = {}
+    self._annotation_name_iids = {}
+    self._string_value_iids = {}
+    self._trace = perfetto_trace_pb2.Trace()
+    self._start_sequence()
+
+  def _start_sequence(self):
+    p = self._add_packet()
+    p.sequence_flags = p.SEQ_INCREMENTAL_STATE_CLEARED
+
+  def _write_packets(self):
+    for p in self._trace.packet:
+      self._writer.write_packet(p)
+    del self._trace.packet[:]
+
+  def _add_packet(self):
+    if self._writer is not None:
+      self._write_packets()
+    p = self._trace.packet.add()
+    p.trusted_packet_sequence_id = 1
+    p.sequence_flags = p.SEQ_NEEDS_INCREMENTAL_STATE
+    p.timestamp_clock_id = 1
+    return p
+
+  def _maybe_add_clock(self, timestamp):
+    if not self._clock_is_set:
+      p = self._add_packet()
+      p.clock_snapshot.primary_trace_clock = 1
+      clock = p.clock_snapshot.clocks.add()
+      clock.timestamp = timestamp
+      clock.clock_id = 1
+      self._clock_is_set = True
+
+  def _get_iid(self, iids, packet, table, field, value):
+    """Returns the iid of an interned string, interning it if it's new.
+
+    Args:
+      iids (dict): Iids of the strings interned so far in `table`
+      packet: Packet that uses the string
+      table (str): Field of `InternedData` that holds the string
+      field (str): Field of the `table` entries that holds the string
+      value (str): The string
+
+    Returns:
+      int: The iid of the string
+    """
+    iid = iids.get(value)
+    if iid is None:
+      iid = len(iids) + 1
+      iids[value] = iid
+      entry = getattr(packet.interned_data, table).add()
+      entry.iid = iid
+      setattr(entry, field, value.encode() if field == "str" else value)
+    return iid
+
+  def _add_instant_event(
+      self, track_id, name, start, metadata=None, interned_keys=()
+  ):
+    """Adds an instant event.
+
+    Args:
+      track_id (int): Uuid of the track
+      name (str): Name of the event
+      start (int): Timestamp of the event in microseconds
+      metadata (dict): Debug annotations of the event
+      interned_keys (Collection[str]): Annotations whose values are interned
+    """
+    self._maybe_add_clock(start)
+    p = self._add_packet()
+    track_event = p.track_event
+    track_event.type = track_event.TYPE_INSTANT
+    track_event.timestamp_absolute_us = start
+    track_event.track_uuid = track_id
+    if not self._intern_strings:
+      track_event.name = name
+      if metadata:
+        add_annotation = track_event.debug_annotations.add
+        for key, value in metadata.items():
+          add_annotation(name=key, string_value=str(value))
+      return
+    track_event.name_iid = self._event_name_iids.get(name) or self._get_iid(
+        self._event_name_iids, p, "event_names", "name", name
+    )
+    if metadata:
+      # Most strings are already interned, so look them up before calling
+      # `_get_iid`.
+      name_iids = self._annotation_name_iids
+      value_iids = self._string_value_iids
+      add_annotation = track_event.debug_annotations.add
+      for key, value in metadata.items():
+        name_iid = name_iids.get(key) or self._get_iid(
+            name_iids, p, "debug_annotation_names", "name", key
+        )
+        value = str(value)
+        if key in interned_keys:
+          value_iid = value_iids.get(value) or self._get_iid(
+              value_iids, p, "debug_annotation_string_values", "str", value
+          )
+          add_annotation(name_iid=name_iid, string_value_iid=value_iid)
+        else:
+          add_annotation(name_iid=name_iid, string_value=value)
+
+  def _add_slice(
+      self, track_id, name, start, end, metadata=None, interned_keys=()
+  ):
+    self._add_instant_event(track_id, name, start, metadata, interned_keys)
+    self._trace.packet[-1].track_event.type = (
+        perfetto_trace_pb2.TrackEvent.TYPE_SLICE_BEGIN
+    )
+    p = self._add_packet()
+    p.track_event.type = p.track_event.TYPE_SLICE_END
+    p.track_event.timestamp_absolute_us = end
+    p.track_event.track_uuid = track_id
+
+  def _add_section(self, uuid, name, parent=None, process_name=None):
+    p = self._add_packet()
+    p.track_descriptor.name = name
+    p.track_descriptor.uuid = uuid
+    if parent:
+      p.track_descriptor.parent_uuid = parent
+
+    if process_name:
+      p.track_descriptor.process.pid = uuid
+      p.track_descriptor.process.process_name = process_name
+
+  def _get_parent_uuid(self, key):
+    if key not in self._parent_uuids:
+      w_uuid = self._counter.next_counter()
+      self._add_section(w_uuid, key, process_name=key)
+      self._parent_uuids[key] = w_uuid
+    return self._parent_uuids[key]
+
+  def _get_section_uuid(self, key, section):
+    if (key, section) not in self._section_uuids:
+      uuid = self._counter.next_counter()
+      self._add_section(uuid, section, parent=self._get_parent_uuid(key))
+      self._section_uuids[(key, section)] = uuid
+    return self._section_uuids[(key, section)]
+
+  def _add_events(self, track_id, names, starts, ends, rows, interned_keys):
+    """Adds the trace events of the logs of a track.
+
+    Args:
+      track_id (int): Uuid of the track
+      names (list[str]): Name of each event
+      starts (list[int]): Timestamp of each event in microseconds
+      ends (list[int]): End of each event in microseconds, None for the
+        instant events
+      rows (list[list[tuple[str, str]]]): Debug annotations of each event
+      interned_keys (Collection[str]): Annotations whose values are interned
+    """
+    for name, start, end, row in zip(names, starts, ends, rows):
+      metadata = dict(row)
+      if end is None:
+        self._add_instant_event(
+            track_id, name, start, metadata, interned_keys
+        )
+      else:
+        self._add_slice(track_id, name, start, end, metadata, interned_keys)
+
+  def add_logs(self, df: pd.DataFrame):
+    """Adds trace events for the given logs.
+
+    The columns are converted once for all the logs, sorted by track, so that
+    no pandas object is built per track or per log. Every non-null column of a
+    log becomes a debug annotation.
+
+    Args:
+      df (pd.DataFrame): Logs data
+    """
+    if len(df) == 0:
+      return
+    df, bounds = sort_by_track(df)
+    columns = df.columns.tolist()
+    strings = [_to_strings(df[column]) for column in columns]
+    rows = [
+        [(key, value) for key, value in zip(columns, row) if value is not None]
+        for row in zip(*strings)
+    ]
+    track_numbers = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+    # Only the values that repeat within a track are worth interning, e.g.
+    # not the insert ids or the timestamps.
+    repeats = [_has_repeats(values, track_numbers) for values in strings]
+    names = df["textPayload"].to_numpy(dtype=object).tolist()
+    starts = get_timestamps_us(df["timestamp"]).tolist()
+    # Runs of repeated logs collapsed into one log span from their first to
+    # their last log.
+    ends = [None] * len(df)
+    if "repeat_count" in df.columns:
+      is_slice = df["repeat_count"].notna().to_numpy()
+      slice_ends = get_timestamps_us(df["last_timestamp"][is_slice])
+      for i, end in zip(np.flatnonzero(is_slice), slice_ends.tolist()):
+        ends[i] = end
+    parents = df["parent"].to_numpy()
+    sections = df["section"].to_numpy()
+    for track, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+      key, section = parents[start], sections[start]
+      self._get_parent_uuid(key)
+      uuid = self._get_section_uuid(key, section)
+      logger.debug("Adding events for parent: %s, section: %s", key, section)
+      interned_keys = {
+          column
+          for column, repeated in zip(columns, repeats)
+          if repeated[track]
+      }
+      self._add_events(
+          uuid,
+          names[start:end],
+          starts[start:end],
+          ends[start:end],
+          rows[start:end],
+          interned_keys,
+      )
+
+  def flush(self) -> bytes:
+    """Returns the packets added since the last flush.
+
+    With a writer, the packets are written to the writer instead.
+
+    Returns:
+      bytes: Trace packets serialized into string format, empty with a writer
+    """
+    if self._writer is not None:
+      self._write_packets()
+      return b""
+    traces = self._trace.SerializeToString()
+    self._trace = perfetto_trace_pb2.Trace()
+    return traces
+
+
+class EncodedTraceBuilder(TraceBuilder):
+  """`TraceBuilder` that encodes the packets to bytes directly.
+
+  Building a protobuf message per packet and per debug annotation dominates
+  the translation time. This builder writes the same packets, byte for byte,
+  with `trace_encoder` into a reusable buffer instead. The encoded debug
+  annotations with interned values are cached, as the same pairs of name and
+  value come back on most logs.
+  """
+
+  def __init__(
+      self,
+      intern_strings: bool = True,
+      writer: Optional[TraceWriter] = None,
+  ):
+    self._buffer = bytearray()
+    self._annotation_cache = {}
+    # Strings interned by the packet being encoded.
+    self._new_event_names = []
+    self._new_annotation_names = []
+    self._new_string_values = []
+    super().__init__(intern_strings, writer)
+
+  def _emit(self, data: bytes):
+    if self._writer is not None:
+      self._writer.write_encoded_packet(data)
+    else:
+      self._buffer += data
+
+  def _start_sequence(self):
+    self._emit(
+        trace_encoder.encode_packet(
+            trace_encoder.SEQ_INCREMENTAL_STATE_CLEARED
+        )
+    )
+
+  def _maybe_add_clock(self, timestamp):
+    if not self._clock_is_set:
+      self._emit(
+          trace_encoder.encode_packet(
+              clock_snapshot=trace_encoder.encode_clock_snapshot(timestamp)
+          )
+      )
+      self._clock_is_set = True
+
+  def _intern(self, iids, new_entries, value):
+    iid = iids.get(value)
+    if iid is None:
+      iid = len(iids) + 1
+      iids[value] = iid
+      new_entries.append((iid, value))
+    return iid
+
+  def _encode_annotations(self, metadata, interned_keys):
+    if not self._intern_strings:
+      return b"".join(
+          trace_encoder.encode_debug_annotation(
+              name=key, string_value=str(value)
+          )
+          for key, value in metadata.items()
+      )
+    annotations = []
+    cache = self._annotation_cache
+    for key, value in metadata.items():
+      value = str(value)
+      if key in interned_keys:
+        annotation = cache.get((key, value))
+        if annotation is None:
+          annotation = trace_encoder.encode_debug_annotation(
+              name_iid=self._intern(
+                  self._annotation_name_iids, self._new_annotation_names, key
+              ),
+              string_value_iid=self._intern(
+                  self._string_value_iids, self._new_string_values, value
+              ),
+          )
+          cache[(key, value)] = annotation
+      else:
+        annotation = trace_encoder.encode_debug_annotation(
+            name_iid=self._intern(
+                self._annotation_name_iids, self._new_annotation_names, key
+            ),
+            string_value=value,
+        )
+      annotations.append(annotation)
+    return b"".join(annotations)
+
+  def _add_event(
+      self, event_type, track_id, name, start, metadata, interned_keys
+  ):
+    self._maybe_add_clock(start)
+    debug_annotations = (
+        self._encode_annotations(metadata, interned_keys) if metadata else b""
+    )
+    if self._intern_strings:
+      track_event = trace_encoder.encode_track_event(
+          event_type,
+          track_id,
+          start,
+          name_iid=self._intern(
+              self._event_name_iids, self._new_event_names, name
+          ),
+          debug_annotations=debug_annotations,
+      )
+    else:
+      track_event = trace_encoder.encode_track_event(
+          event_type,
+          track_id,
+          start,
+          name=name,
+          debug_annotations=debug_annotations,
+      )
+    interned_data = None
+    if (
+        self._new_event_names
+        or self._new_annotation_names
+        or self._new_string_values
+    ):
+      interned_data = trace_encoder.encode_interned_data(
+          self._new_event_names,
+          self._new_annotation_names,
+          self._new_string_values,
+      )
+      self._new_event_names = []
+      self._new_annotation_names = []
+      self._new_string_values = []
+    self._emit(
+        trace_encoder.encode_packet(
+            track_event=track_event, interned_data=interned_data
+        )
+    )
+
+  def _add_instant_event(
+      self, track_id, name, start, metadata=None, interned_keys=()
+  ):
+    self._add_event(
+        trace_encoder.TYPE_INSTANT,
+        track_id,
+        name,
+        start,
+        metadata,
+        interned_keys,
+    )
+
+  def _add_slice(
+      self, track_id, name, start, end, metadata=None, interned_keys=()
+  ):
+    self._add_event(
+        trace_encoder.TYPE_SLICE_BEGIN,
+        track_id,
+        name,
+        start,
+        metadata,
+        interned_keys,
+    )
+    self._emit(
+        trace_encoder.encode_packet(
+            track_event=trace_encoder.encode_track_event(
+                trace_encoder.TYPE_SLICE_END, track_id, end
+            )
+        )
+    )
+
+  def _add_section(self, uuid, name, parent=None, process_name=None):
+    self._emit(
+        trace_encoder.encode_packet(
+            track_descriptor=trace_encoder.encode_track_descriptor(
+                uuid,
+                name,
+                parent_uuid=parent or None,
+                process_name=process_name or None,
+            )
+        )
+    )
+
+  def flush(self) -> bytes:
+    traces = bytes(self._buffer)
+    self._buffer.clear()
+    return traces
+
+
+def get_trace_builder(
+    intern_strings: bool = True,
+    writer: Optional[TraceWriter] = None,
+    fast_encoder: bool = False,
+) -> TraceBuilder:
+  """Returns a trace builder.
+
+  Args:
+    intern_strings (bool): Whether to intern the strings of the events
+    writer (TraceWriter): Optional writer the packets are streamed to
+    fast_encoder (bool): Whether to encode the packets without protobuf
+      messages, see `EncodedTraceBuilder`
+
+  Returns:
+    TraceBuilder: The trace builder
+  """
+  if fast_encoder:
+    return EncodedTraceBuilder(intern_strings, writer)
+  return TraceBuilder(intern_strings, writer)
+
+
+def translate_to_traces(
+    df: pd.DataFrame, intern_strings: bool = True, fast_encoder: bool = False
+) -> bytes:
   """Translates the logs to trace events.
 
   The conversion logic builds a hierarchy of traces using the unique values of
@@ -66,126 +680,119 @@ def translate_to_traces(df: pd.DataFrame) -> bytes:
 
   Args:
     df (pd.DataFrame): Logs data
+    intern_strings (bool): Whether to intern the strings of the events
+    fast_encoder (bool): Whether to encode the packets without protobuf
+      messages
 
   Returns:
     bytes: Trace events serialized into string format
   """
   logger.debug("Starting the log->trace translation.")
-  counter = Counter()
-  clock_is_set = False
+  builder = get_trace_builder(intern_strings, fast_encoder=fast_encoder)
+  builder.add_logs(df)
+  logger.debug("Log->trace translation completed")
+  return builder.flush()
 
-  def next_counter():
-    return counter.next_counter()
 
-  def add_packet(t):
-    p = t.packet.add()
-    p.trusted_packet_sequence_id = 1
-    p.sequence_flags = p.SEQ_NEEDS_INCREMENTAL_STATE
-    p.timestamp_clock_id = 1
-    return p
+def write_traces(
+    input_filepath: str,
+    df: pd.DataFrame,
+    intern_strings: bool = True,
+    fast_encoder: bool = False,
+):
+  """Translates the logs to trace events and streams them to the trace file.
 
-  def maybe_add_clock(timestamp):
-    nonlocal clock_is_set
-    if not clock_is_set:
-      p = add_packet(t)
-      p.clock_snapshot.primary_trace_clock = 1
-      clock = p.clock_snapshot.clocks.add()
-      clock.timestamp = timestamp
-      clock.clock_id = 1
-      clock_is_set = True
+  Unlike `dump_traces(translate_to_traces(df))`, only one packet is held in
+  memory at a time.
 
-  def add_instant_event(track_id, name, start, metadata=None):
-    maybe_add_clock(start)
-    p = add_packet(t)
-    p.track_event.type = p.track_event.TYPE_INSTANT
-    p.track_event.timestamp_absolute_us = start
-    p.track_event.track_uuid = track_id
-    p.track_event.name = name
-    if metadata:
-      for key, value in metadata.items():
-        d = p.track_event.debug_annotations.add()
-        d.name = key
-        d.string_value = str(value)
+  Args:
+    input_filepath (str): The path to the input file
+    df (pd.DataFrame): Logs data
+    intern_strings (bool): Whether to intern the strings of the events
+    fast_encoder (bool): Whether to encode the packets without protobuf
+      messages
+  """
+  logger.debug("Starting the log->trace translation.")
+  with TraceWriter(input_filepath) as writer:
+    builder = get_trace_builder(intern_strings, writer, fast_encoder)
+    builder.add_logs(df)
+    builder.flush()
+  logger.debug("Log->trace translation completed")
+  dump_html(input_filepath)
 
-  def add_section(uuid, name, parent=None, process_name=None):
-    p = add_packet(t)
-    p.track_descriptor.name = name
-    p.track_descriptor.uuid = uuid
-    if parent:
-      p.track_descriptor.parent_uuid = parent
 
-    if process_name:
-      p.track_descriptor.process.pid = uuid
-      p.track_descriptor.process.process_name = process_name
+def get_output_stem(input_filepath: str) -> pathlib.Path:
+  """Returns the input path without its compression and format suffixes.
 
-  t = perfetto_trace_pb2.Trace()
-  p = add_packet(t)
-  p.sequence_flags = p.SEQ_INCREMENTAL_STATE_CLEARED
-
-  for key in df["parent"].unique():
-    value = df[df["parent"] == key]
-    w_uuid = next_counter()
-    add_section(w_uuid, key, process_name=key)
-    logger.debug("Adding events for parent: %s", key)
-    for section in value.section.unique():
-      uuid = next_counter()
-      add_section(uuid, section, parent=w_uuid)
-      logger.debug("Adding events for section: %s", section)
-
-      def add_events(event, uuid=uuid):
-        name = event.textPayload  # Marker color
-
-        try:
-          # This block handles string timestamps, assuming ISO 8601 format.
-          # The original code had a dangerous eval and broken strptime here.
-          ts_str = event.timestamp
-          if not isinstance(ts_str, str):
-            raise TypeError("Not a string, try parsing as datetime object.")
-
-          # Truncate to microseconds if there are nanoseconds.
-          t_micro = re.sub(r"(\.\d{6})\d*(Z?)$", r"\1\2", ts_str)
-          # fromisoformat before Python 3.11 doesn't like 'Z'
-          if t_micro.endswith("Z"):
-            t_micro = t_micro[:-1] + "+00:00"
-          dt = datetime.datetime.fromisoformat(t_micro)
-          timestamp_us = int(dt.timestamp() * 1_000_000)
-        except (TypeError, ValueError):
-          # This block handles datetime objects
-          timestamp_us = int(event.timestamp.timestamp() * 1_000_000)
-
-        metadata = {
-            k: v for k, v in event.dropna().to_dict().items() if not pd.isna(v)
-        }
-        add_instant_event(uuid, name, timestamp_us, metadata)
-
-      value[value["section"] == section].apply(add_events, axis=1)
+  E.g. both `logs.jsonl` and `logs.jsonl.gz` give `logs`, so that the trace
+  file `logs.gz` doesn't overwrite a compressed input.
 
-  logger.debug("Log->trace translation completed")
-  return t.SerializeToString()
+  Args:
+    input_filepath (str): The path to the input file
 
+  Returns:
+    pathlib.Path: The path of the output files without their suffix
+  """
+  p = pathlib.Path(input_filepath)
+  if p.suffix in constants.COMPRESSED_FILE_SUFFIXES:
+    p = p.with_suffix("")
+  return p.with_suffix("")
 
-def dump_traces(input_filepath: str, traces: bytes):
-  """Dumps traces to the gives filepath.
+
+def get_trace_filepath(input_filepath: str) -> str:
+  """Returns the path of the .gz trace file for the given input file.
 
   Args:
     input_filepath (str): The path to the input file
-    traces (bytes): The traces to dump
+
+  Returns:
+    str: The path to the .gz trace file
   """
-  p = pathlib.Path(input_filepath)
-  gz_output_filepath = os.path.join(str(p.parent), p.stem + ".gz")
-  logger.debug("Saving the traces at %s", gz_output_filepath)
-  with open(gz_output_filepath, "wb") as fp:
+  return str(get_output_stem(input_filepath)) + ".gz"
+
+
+def get_html_filepath(input_filepath: str) -> str:
+  """Returns the path of the HTML page for the given input file.
+
+  Args:
+    input_filepath (str): The path to the input file
+
+  Returns:
+    str: The path to the HTML page
+  """
+  return str(get_output_stem(input_filepath)) + ".html"
+
+
+def append_traces(input_filepath: str, traces: bytes):
+  """Appends traces to the .gz trace file as a new gzip member.
+
+  Args:
+    input_filepath (str): The path to the input file
+    traces (bytes): The traces to append
+  """
+  gz_output_filepath = get_trace_filepath(input_filepath)
+  logger.debug("Appending %d bytes of traces at %s", len(traces),
+               gz_output_filepath)
+  with open(gz_output_filepath, "ab") as fp:
     fp.write(gzip.compress(traces))
 
-  html_output_filepath = os.path.join(str(p.parent), p.stem + ".html")
+
+def dump_html(input_filepath: str):
+  """Dumps the HTML page that loads the .gz trace file.
+
+  Args:
+    input_filepath (str): The path to the input file
+  """
+  stem = get_output_stem(input_filepath).name
+  html_output_filepath = get_html_filepath(input_filepath)
   logger.debug("Building the HTML at %s", html_output_filepath)
   with open(html_output_filepath, "w") as fp:
     html_template = string.Template(constants.PERFETTO_TEMPLATE_HTML)
     fp.write(
         html_template.substitute(
             dict(
-                trace_file=f"./{p.stem}.gz",
-                title=p.stem,
+                trace_file=f"./{stem}.gz",
+                title=stem,
             )
         )
     )
@@ -196,5 +803,20 @@ def dump_traces(input_filepath: str, traces: bytes):
       " from the output directory OR upload the trace file to"
       " https://perfetto.dev.",
       html_output_filepath,
-      gz_output_filepath,
+      get_trace_filepath(input_filepath),
   )
+
+
+def dump_traces(input_filepath: str, traces: bytes):
+  """Dumps traces to the gives filepath.
+
+  Args:
+    input_filepath (str): The path to the input file
+    traces (bytes): The traces to dump
+  """
+  gz_output_filepath = get_trace_filepath(input_filepath)
+  logger.debug("Saving the traces at %s", gz_output_filepath)
+  with open(gz_output_filepath, "wb") as fp:
+    fp.write(gzip.compress(traces))
+
+  dump_html(input_filepath)
@@ -0,0 +1,320 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Rule sets that filter out the redundant logs and section the others.
+
+The built-in rules live in `constants`. Extra rule packs are JSON files with
+any of the keys of `RuleSet`, e.g.:
+
+  {
+    "redundant_logs_exact": ["Starting the data loader."],
+    "redundant_logs_substr_match": ["Loaded shard \\d+ of"],
+    "redundant_severity_in_files": {"data_loader.py": "INFO"},
+    "section_rules": {"Preempted": "Preemption"}
+  }
+"""
+
+import functools
+import json
+import logging
+from typing import Optional
+
+from mltrace import constants
+from mltrace import matcher
+
+logger = logging.getLogger(__name__)
+
+RULE_LIST_KEYS = [
+    "redundant_logs_exact",
+    "file_only_redundant_logs_exact",
+    "redundant_logs_substr_match",
+    "file_only_redundant_logs_substr_match",
+]
+RULE_DICT_KEYS = [
+    "redundant_severity_in_files",
+    "section_rules",
+]
+
+
+def _escape_filter_regexp(regexp: str) -> str:
+  # Per Cloud Logging docs, regex patterns must be in double quotes.
+  # We must escape backslashes and double quotes inside the pattern.
+  return regexp.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _split_re2_patterns(patterns: list[str]) -> tuple[list[str], list[str]]:
+  """Splits regexes into the ones RE2 can run and the others.
+
+  Cloud Logging filters use RE2, which has no lookarounds or backreferences.
+  Without pyarrow, the patterns can't be checked, so none of them is RE2.
+
+  Args:
+    patterns (list[str]): Python regular expressions
+
+  Returns:
+    tuple[list[str], list[str]]: The RE2 patterns and the other ones
+  """
+  if matcher.pa is None:
+    return [], list(patterns)
+  re2_patterns = []
+  other_patterns = []
+  for pattern in patterns:
+    if matcher.to_re2(pattern) is None:
+      other_patterns.append(pattern)
+    else:
+      re2_patterns.append(pattern)
+  return re2_patterns, other_patterns
+
+
+class RuleSet:
+  """Rules that filter out the redundant logs and section the others.
+
+  Attributes:
+    redundant_logs_exact (list[str]): Texts of the logs to filter out
+    file_only_redundant_logs_exact (list[str]): Texts of the logs to filter
+      out, only applied locally and not in the Cloud Logging filter
+    redundant_logs_substr_match (list[str]): Regexes found in the logs to
+      filter out
+    file_only_redundant_logs_substr_match (list[str]): Regexes found in the
+      logs to filter out, only applied locally and not in the Cloud Logging
+      filter
+    redundant_severity_in_files (dict[str, str]): Source file -> severity of
+      the logs to filter out
+    section_rules (dict[str, str]): Case-insensitive regex -> section of the
+      logs it is found in. The last matching rule wins.
+  """
+
+  def __init__(
+      self,
+      redundant_logs_exact: Optional[list[str]] = None,
+      file_only_redundant_logs_exact: Optional[list[str]] = None,
+      redundant_logs_substr_match: Optional[list[str]] = None,
+      file_only_redundant_logs_substr_match: Optional[list[str]] = None,
+      redundant_severity_in_files: Optional[dict[str, str]] = None,
+      section_rules: Optional[dict[str, str]] = None,
+  ):
+    self.redundant_logs_exact = list(redundant_logs_exact or [])
+    self.file_only_redundant_logs_exact = list(
+        file_only_redundant_logs_exact or []
+    )
+    self.redundant_logs_substr_match = list(redundant_logs_substr_match or [])
+    self.file_only_redundant_logs_substr_match = list(
+        file_only_redundant_logs_substr_match or []
+    )
+    self.redundant_severity_in_files = dict(redundant_severity_in_files or {})
+    self.section_rules = dict(section_rules or {})
+    self._compiled = None
+    self._arrow_compiled = None
+
+  @classmethod
+  def from_dict(cls, rules: dict) -> "RuleSet":
+    """Builds a rule set from a dict with the keys of the attributes.
+
+    The regexes of `redundant_logs_substr_match` that the Cloud Logging filter
+    can't run, i.e. that have no RE2 equivalent, are only applied locally.
+
+    Args:
+      rules (dict): Rules keyed by attribute name
+
+    Returns:
+      RuleSet: The rule set
+
+    Raises:
+      ValueError: If a key is unknown or a value has the wrong type
+    """
+    unknown_keys = rules.keys() - set(RULE_LIST_KEYS + RULE_DICT_KEYS)
+    if unknown_keys:
+      raise ValueError(
+          f"Unknown rule keys {sorted(unknown_keys)}. Supported:"
+          f" {RULE_LIST_KEYS + RULE_DICT_KEYS}"
+      )
+    for key in RULE_LIST_KEYS:
+      if key in rules and not (
+          isinstance(rules[key], list)
+          and all(isinstance(v, str) for v in rules[key])
+      ):
+        raise ValueError(f"`{key}` must be a list of strings")
+    for key in RULE_DICT_KEYS:
+      if key in rules and not (
+          isinstance(rules[key], dict)
+          and all(isinstance(v, str) for v in rules[key].values())
+      ):
+        raise ValueError(f"`{key}` must map strings to strings")
+    rules = dict(rules)
+    re2_patterns, other_patterns = _split_re2_patterns(
+        rules.get("redundant_logs_substr_match", [])
+    )
+    if other_patterns:
+      if matcher.pa is None:
+        logger.info(
+            "Only applying the regexes of the rule pack locally. Install"
+            " pyarrow to also apply them in the Cloud Logging filter."
+        )
+      else:
+        logger.warning(
+            "Only applying %s locally, since they have no RE2 equivalent for"
+            " the Cloud Logging filter.",
+            other_patterns,
+        )
+      rules["redundant_logs_substr_match"] = re2_patterns
+      rules["file_only_redundant_logs_substr_match"] = (
+          rules.get("file_only_redundant_logs_substr_match", [])
+          + other_patterns
+      )
+    return cls(**rules)
+
+  @classmethod
+  def from_file(cls, path: str) -> "RuleSet":
+    """Loads a rule pack from a JSON file.
+
+    Args:
+      path (str): Path to the JSON file
+
+    Returns:
+      RuleSet: The rule set
+
+    Raises:
+      ValueError: If the file is not a valid rule pack
+    """
+    with open(path, "r") as fp:
+      rules = json.load(fp)
+    if not isinstance(rules, dict):
+      raise ValueError(f"{path} must hold a JSON object")
+    try:
+      return cls.from_dict(rules)
+    except ValueError as e:
+      raise ValueError(f"Invalid rule pack {path}: {e}") from e
+
+  def to_dict(self) -> dict:
+    """Returns the rules keyed by attribute name."""
+    return {key: getattr(self, key) for key in RULE_LIST_KEYS + RULE_DICT_KEYS}
+
+  def merge(self, other: "RuleSet") -> "RuleSet":
+    """Returns the rules of both rule sets.
+
+    The rules of `other` come after the rules of this set, so its section
+    rules take precedence. Its severities override the ones of this set for
+    the same files.
+
+    Args:
+      other (RuleSet): Rules to add
+
+    Returns:
+      RuleSet: The merged rule set
+    """
+    merged = {}
+    for key in RULE_LIST_KEYS:
+      merged[key] = list(
+          dict.fromkeys(getattr(self, key) + getattr(other, key))
+      )
+    for key in RULE_DICT_KEYS:
+      merged[key] = {**getattr(self, key), **getattr(other, key)}
+    return RuleSet(**merged)
+
+  def compile(self):
+    """Compiles the rules into the matchers used by the parser."""
+    self._compiled = (
+        matcher.PatternMatcher(self._get_substr_match_patterns()),
+        matcher.SectionClassifier(self.section_rules),
+    )
+
+  @property
+  def redundant_logs_matcher(self) -> matcher.PatternMatcher:
+    """Matcher of the substring-match regexes, compiled on first use."""
+    if self._compiled is None:
+      self.compile()
+    return self._compiled[0]
+
+  @property
+  def section_classifier(self) -> matcher.SectionClassifier:
+    """Classifier of `section_rules`, compiled on first use."""
+    if self._compiled is None:
+      self.compile()
+    return self._compiled[1]
+
+  def _get_substr_match_patterns(self) -> list[str]:
+    return (
+        self.redundant_logs_substr_match
+        + self.file_only_redundant_logs_substr_match
+    )
+
+  def _compile_arrow(self):
+    self._arrow_compiled = (
+        matcher.ArrowPatternMatcher(self._get_substr_match_patterns()),
+        matcher.ArrowSectionClassifier(self.section_rules),
+    )
+
+  @property
+  def arrow_redundant_logs_matcher(self) -> matcher.ArrowPatternMatcher:
+    """Arrow matcher of the substring-match regexes, built on first use."""
+    if self._arrow_compiled is None:
+      self._compile_arrow()
+    return self._arrow_compiled[0]
+
+  @property
+  def arrow_section_classifier(self) -> matcher.ArrowSectionClassifier:
+    """Arrow classifier of `section_rules`, built on first use."""
+    if self._arrow_compiled is None:
+      self._compile_arrow()
+    return self._arrow_compiled[1]
+
+  def build_cloud_logging_filter(self) -> str:
+    """Builds the Cloud Logging filter clauses that exclude redundant logs.
+
+    Returns:
+      str: Space-separated filter clauses
+    """
+    log_filter = ""
+    for regexp in self.redundant_logs_substr_match:
+      log_filter += f'textPayload!~"{_escape_filter_regexp(regexp)}" '
+
+    # Exact texts are compared as strings, not regexes: the texts of a rule
+    # pack aren't escaped, and a substring match drops more than the local
+    # filter does.
+    for text in self.redundant_logs_exact:
+      log_filter += f'textPayload!="{_escape_filter_regexp(text)}" '
+
+    log_filter += " AND ".join([
+        f"sourceLocation.file!={filename} OR severity!={severity}"
+        for filename, severity in self.redundant_severity_in_files.items()
+    ])
+    return log_filter
+
+
+@functools.cache
+def get_default_rule_set() -> RuleSet:
+  """Returns the built-in rules."""
+  return RuleSet(
+      redundant_logs_exact=constants.REDUNDANT_LOGS_EXACT,
+      file_only_redundant_logs_exact=constants.FILE_ONLY_REDUNDANT_LOGS_EXACT,
+      redundant_logs_substr_match=constants.REDUNDANT_LOGS_SUBSTR_MATCH,
+      redundant_severity_in_files=constants.REDUNDANT_SEVERITY_IN_FILES,
+      section_rules=constants.REGEX_SUBSTR_MATCH_ROW_HEADERS,
+  )
+
+
+def load_rule_set(paths: Optional[list[str]] = None) -> RuleSet:
+  """Loads the built-in rules merged with the given rule packs, compiled.
+
+  Args:
+    paths (list[str]): Paths to the JSON rule packs, merged in order
+
+  Returns:
+    RuleSet: The compiled rule set
+  """
+  rule_set = get_default_rule_set()
+  for path in paths or []:
+    logger.info("Loading the rule pack %s", path)
+    rule_set = rule_set.merge(RuleSet.from_file(path))
+  rule_set.compile()
+  return rule_set
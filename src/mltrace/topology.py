@@ -0,0 +1,140 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Resolves the parent group and worker of the logs from their pod names."""
+
+import logging
+import re
+from typing import Optional
+
+from mltrace import categorical_utils
+from mltrace import constants
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _broadcast(column: pd.Series, values: list) -> pd.Series:
+  """Maps each category of a categorical column to the given value.
+
+  Args:
+      column (pd.Series): Categorical column
+      values (list): Value of each category, in the order of the categories
+
+  Returns:
+      pd.Series: Categorical column with the value of each row
+  """
+  value_codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+  # Rows without a category have code -1, which picks the appended -1.
+  codes = np.append(value_codes, -1)[column.cat.codes.to_numpy()]
+  return pd.Series(
+      pd.Categorical.from_codes(codes, categories=uniques),
+      index=column.index,
+  )
+
+
+def _get_worker_parent(worker_num):
+  """Returns the parent group of a McJAX slice#-worker#."""
+  if pd.isna(worker_num):
+    return np.nan
+  # slice#0 worker#0 is the Coordinator.
+  if worker_num == "0-0":
+    return constants.COORDINATOR_GROUP
+  return constants.WORKER_GROUP_PREFIX + worker_num
+
+
+class TopologyResolver:
+  """Resolves the parent group and worker of each log.
+
+  A jobset has a few hundred pods for millions of logs, so the pod names are
+  parsed once per unique name and the results are broadcast back to the logs.
+  The parsed names are cached, and the McJAX/Pathways detection is kept after
+  the first batch of logs, so that the same resolver can be reused across the
+  chunks of a streamed read.
+  """
+
+  def __init__(self, jobname: str, is_mcjax: Optional[bool] = None):
+    """Initializes the resolver.
+
+    Args:
+        jobname (str): Name of the workload
+        is_mcjax (bool): Whether the workload is a McJAX workload. Detected
+          from the first logs by default.
+    """
+    self.is_mcjax = is_mcjax
+    self._group_regex = re.compile(rf"{jobname}-(.*?)-")
+    self._worker_regex = re.compile(rf"{jobname}-.*?-(\d*?-\d*?)-")
+    self._groups = {}  # pod name -> group in the pod name
+    self._workers = {}  # pod name -> slice#-worker# in the pod name
+
+  def _lookup(
+      self, cache: dict, regex: re.Pattern, pod_names: pd.Index
+  ) -> list:
+    """Returns the first group of the regex in each pod name."""
+    values = []
+    for pod_name in pod_names:
+      if pod_name not in cache:
+        match = regex.search(pod_name)
+        cache[pod_name] = match.group(1) if match else np.nan
+      values.append(cache[pod_name])
+    return values
+
+  def _detect_mcjax(self, pod_names: pd.Series) -> bool:
+    """Detects a McJAX workload from the groups of its pod names."""
+    codes = pod_names.cat.codes.to_numpy()
+    used = pod_names.cat.categories[np.unique(codes[codes >= 0])]
+    groups = set(self._lookup(self._groups, self._group_regex, used))
+    # todo: Use a better way to identify a McJAX vs Pathways workload.
+    return "slice" in groups or "job" in groups
+
+  def resolve(self, logs: pd.DataFrame) -> pd.DataFrame:
+    """Adds the parent group of each log.
+
+    McJAX logs are grouped by slice#-worker#, which is also added as the
+    "worker_num" column, with slice#0 worker#0 as the Coordinator. Pathways
+    logs are grouped by container.
+
+    Args:
+        logs (pd.DataFrame): Workload logs
+
+    Returns:
+        pd.DataFrame: Logs with a new "parent" column
+    """
+    pod_names = logs["resource.labels.pod_name"]
+    if not isinstance(pod_names.dtype, pd.CategoricalDtype):
+      pod_names = pod_names.astype("category")
+    if self.is_mcjax is None:
+      self.is_mcjax = self._detect_mcjax(pod_names)
+      if self.is_mcjax:
+        logger.info("McJAX workload detected.")
+      else:
+        logger.info("Pathways workload detected.")
+
+    if self.is_mcjax:
+      workers = self._lookup(
+          self._workers, self._worker_regex, pod_names.cat.categories
+      )
+      parents = [_get_worker_parent(worker) for worker in workers]
+      return logs.assign(
+          parent=_broadcast(pod_names, parents),
+          worker_num=_broadcast(pod_names, workers),
+      )
+
+    # Use the container name for defining the top-level section for Pathways.
+    containers = logs["resource.labels.container_name"]
+    return logs.assign(
+        parent=categorical_utils.set_where(
+            containers, containers == "", "Outside a container"
+        )
+    )
@@ -0,0 +1,318 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Encodes trace packets to bytes without building protobuf messages.
+
+Only the few fields of `TracePacket` that mltrace writes are supported. The
+fields of each message are written in the order of their field numbers, like
+the protobuf serializer does, so the output is byte-identical to serializing
+the same `perfetto_trace_pb2` messages.
+"""
+
+import functools
+from typing import Optional
+
+# Wire types
+VARINT = 0
+LENGTH_DELIMITED = 2
+
+# TrackEvent.Type
+TYPE_SLICE_BEGIN = 1
+TYPE_SLICE_END = 2
+TYPE_INSTANT = 3
+
+# TracePacket.SequenceFlags
+SEQ_INCREMENTAL_STATE_CLEARED = 1
+SEQ_NEEDS_INCREMENTAL_STATE = 2
+
+# Most varints are small, e.g. the lengths, the iids and the uuids.
+_ONE_BYTE_VARINTS = [bytes((value,)) for value in range(0x80)]
+
+
+def encode_varint(value: int) -> bytes:
+  """Encodes an integer as a protobuf varint.
+
+  Negative values are encoded as their 64-bit two's complement, like int64
+  fields.
+
+  Args:
+    value (int): The integer
+
+  Returns:
+    bytes: The varint
+  """
+  if 0 <= value < 0x80:
+    return _ONE_BYTE_VARINTS[value]
+  value &= 0xFFFFFFFFFFFFFFFF
+  out = bytearray()
+  while value > 0x7F:
+    out.append((value & 0x7F) | 0x80)
+    value >>= 7
+  out.append(value)
+  return bytes(out)
+
+
+@functools.cache
+def _key(field_number: int, wire_type: int) -> bytes:
+  return encode_varint(field_number << 3 | wire_type)
+
+
+def encode_varint_field(field_number: int, value: int) -> bytes:
+  """Encodes an integer or enum field."""
+  return _key(field_number, VARINT) + encode_varint(value)
+
+
+def encode_bytes_field(field_number: int, data: bytes) -> bytes:
+  """Encodes a bytes, string or message field from its serialized bytes."""
+  return (
+      _key(field_number, LENGTH_DELIMITED) + encode_varint(len(data)) + data
+  )
+
+
+def encode_string_field(field_number: int, value: str) -> bytes:
+  """Encodes a string field."""
+  return encode_bytes_field(field_number, value.encode())
+
+
+def frame_packet(data: bytes) -> bytes:
+  """Encodes a serialized `TracePacket` as a field 1 (`packet`) of `Trace`.
+
+  Args:
+    data (bytes): The serialized packet
+
+  Returns:
+    bytes: The packet as it is serialized in a `Trace`
+  """
+  return _TRACE_PACKET + encode_varint(len(data)) + data
+
+
+# Keys of the fields written for every packet and event, named after their
+# message and field.
+_TRACE_PACKET = _key(1, LENGTH_DELIMITED)
+_PACKET_CLOCK_SNAPSHOT = _key(6, LENGTH_DELIMITED)
+_PACKET_TRACK_EVENT = _key(11, LENGTH_DELIMITED)
+_PACKET_INTERNED_DATA = _key(12, LENGTH_DELIMITED)
+_PACKET_SEQUENCE_FLAGS = _key(13, VARINT)
+_PACKET_TRACK_DESCRIPTOR = _key(60, LENGTH_DELIMITED)
+_EVENT_DEBUG_ANNOTATIONS = _key(4, LENGTH_DELIMITED)
+_EVENT_TYPE = _key(9, VARINT)
+_EVENT_NAME_IID = _key(10, VARINT)
+_EVENT_TRACK_UUID = _key(11, VARINT)
+_EVENT_TIMESTAMP_ABSOLUTE_US = _key(16, VARINT)
+_EVENT_NAME = _key(23, LENGTH_DELIMITED)
+_ANNOTATION_NAME_IID = _key(1, VARINT)
+_ANNOTATION_STRING_VALUE = _key(6, LENGTH_DELIMITED)
+_ANNOTATION_NAME = _key(10, LENGTH_DELIMITED)
+_ANNOTATION_STRING_VALUE_IID = _key(17, VARINT)
+
+# Fields every packet of mltrace sets: trusted_packet_sequence_id (10) and
+# timestamp_clock_id (58), both 1.
+_TRUSTED_PACKET_SEQUENCE_ID = encode_varint_field(10, 1)
+_TIMESTAMP_CLOCK_ID = encode_varint_field(58, 1)
+
+
+def encode_packet(
+    sequence_flags: int = SEQ_NEEDS_INCREMENTAL_STATE,
+    clock_snapshot: Optional[bytes] = None,
+    track_event: Optional[bytes] = None,
+    interned_data: Optional[bytes] = None,
+    track_descriptor: Optional[bytes] = None,
+) -> bytes:
+  """Encodes a `TracePacket`, framed as a field of `Trace`.
+
+  Args:
+    sequence_flags (int): Flags of the packet sequence
+    clock_snapshot (bytes): Encoded `ClockSnapshot`, if any
+    track_event (bytes): Encoded `TrackEvent`, if any
+    interned_data (bytes): Encoded `InternedData`, if any
+    track_descriptor (bytes): Encoded `TrackDescriptor`, if any
+
+  Returns:
+    bytes: The framed packet
+  """
+  parts = []
+  if clock_snapshot is not None:
+    parts += (
+        _PACKET_CLOCK_SNAPSHOT,
+        encode_varint(len(clock_snapshot)),
+        clock_snapshot,
+    )
+  parts.append(_TRUSTED_PACKET_SEQUENCE_ID)
+  if track_event is not None:
+    parts += (_PACKET_TRACK_EVENT, encode_varint(len(track_event)), track_event)
+  if interned_data is not None:
+    parts += (
+        _PACKET_INTERNED_DATA,
+        encode_varint(len(interned_data)),
+        interned_data,
+    )
+  parts += (
+      _PACKET_SEQUENCE_FLAGS,
+      encode_varint(sequence_flags),
+      _TIMESTAMP_CLOCK_ID,
+  )
+  if track_descriptor is not None:
+    parts += (
+        _PACKET_TRACK_DESCRIPTOR,
+        encode_varint(len(track_descriptor)),
+        track_descriptor,
+    )
+  return frame_packet(b"".join(parts))
+
+
+def encode_clock_snapshot(timestamp: int, clock_id: int = 1) -> bytes:
+  """Encodes a `ClockSnapshot` of a single clock, which is the primary clock.
+
+  Args:
+    timestamp (int): Timestamp of the clock
+    clock_id (int): Id of the clock
+
+  Returns:
+    bytes: The encoded message
+  """
+  clock = encode_varint_field(1, clock_id) + encode_varint_field(2, timestamp)
+  return encode_bytes_field(1, clock) + encode_varint_field(2, clock_id)
+
+
+def encode_track_descriptor(
+    uuid: int,
+    name: str,
+    parent_uuid: Optional[int] = None,
+    process_name: Optional[str] = None,
+) -> bytes:
+  """Encodes a `TrackDescriptor`.
+
+  Args:
+    uuid (int): Uuid of the track
+    name (str): Name of the track
+    parent_uuid (int): Uuid of the parent track, if any
+    process_name (str): Process name of the track, if it's a process track.
+      The pid is the uuid.
+
+  Returns:
+    bytes: The encoded message
+  """
+  parts = [encode_varint_field(1, uuid), encode_string_field(2, name)]
+  if process_name is not None:
+    process = encode_varint_field(1, uuid) + encode_string_field(
+        6, process_name
+    )
+    parts.append(encode_bytes_field(3, process))
+  if parent_uuid is not None:
+    parts.append(encode_varint_field(5, parent_uuid))
+  return b"".join(parts)
+
+
+def encode_debug_annotation(
+    name: Optional[str] = None,
+    name_iid: Optional[int] = None,
+    string_value: Optional[str] = None,
+    string_value_iid: Optional[int] = None,
+) -> bytes:
+  """Encodes a string `DebugAnnotation`, framed as a field of `TrackEvent`.
+
+  Args:
+    name (str): Name of the annotation, unless it's interned
+    name_iid (int): Iid of the interned name
+    string_value (str): Value of the annotation, unless it's interned
+    string_value_iid (int): Iid of the interned value
+
+  Returns:
+    bytes: The framed annotation
+  """
+  parts = []
+  if name_iid is not None:
+    parts += (_ANNOTATION_NAME_IID, encode_varint(name_iid))
+  if string_value is not None:
+    data = string_value.encode()
+    parts += (_ANNOTATION_STRING_VALUE, encode_varint(len(data)), data)
+  if name is not None:
+    data = name.encode()
+    parts += (_ANNOTATION_NAME, encode_varint(len(data)), data)
+  if string_value_iid is not None:
+    parts += (_ANNOTATION_STRING_VALUE_IID, encode_varint(string_value_iid))
+  annotation = b"".join(parts)
+  return (
+      _EVENT_DEBUG_ANNOTATIONS + encode_varint(len(annotation)) + annotation
+  )
+
+
+def encode_track_event(
+    event_type: int,
+    track_uuid: int,
+    timestamp_us: int,
+    name: Optional[str] = None,
+    name_iid: Optional[int] = None,
+    debug_annotations: bytes = b"",
+) -> bytes:
+  """Encodes a `TrackEvent`.
+
+  Args:
+    event_type (int): Type of the event
+    track_uuid (int): Uuid of the track
+    timestamp_us (int): Absolute timestamp of the event in microseconds
+    name (str): Name of the event, unless it's interned or it has no name
+    name_iid (int): Iid of the interned name
+    debug_annotations (bytes): Annotations encoded by
+      `encode_debug_annotation`
+
+  Returns:
+    bytes: The encoded message
+  """
+  parts = [debug_annotations, _EVENT_TYPE, encode_varint(event_type)]
+  if name_iid is not None:
+    parts += (_EVENT_NAME_IID, encode_varint(name_iid))
+  parts += (
+      _EVENT_TRACK_UUID,
+      encode_varint(track_uuid),
+      _EVENT_TIMESTAMP_ABSOLUTE_US,
+      encode_varint(timestamp_us),
+  )
+  if name is not None:
+    data = name.encode()
+    parts += (_EVENT_NAME, encode_varint(len(data)), data)
+  return b"".join(parts)
+
+
+def encode_interned_data(
+    event_names: list[tuple[int, str]],
+    debug_annotation_names: list[tuple[int, str]],
+    debug_annotation_string_values: list[tuple[int, str]],
+) -> bytes:
+  """Encodes an `InternedData`.
+
+  Args:
+    event_names (list[tuple[int, str]]): Iids and strings of the new event
+      names
+    debug_annotation_names (list[tuple[int, str]]): Iids and strings of the
+      new annotation names
+    debug_annotation_string_values (list[tuple[int, str]]): Iids and strings
+      of the new annotation values
+
+  Returns:
+    bytes: The encoded message
+  """
+  parts = []
+  for field_number, entries in (
+      (2, event_names),
+      (3, debug_annotation_names),
+      (29, debug_annotation_string_values),
+  ):
+    for iid, value in entries:
+      parts.append(
+          encode_bytes_field(
+              field_number,
+              encode_varint_field(1, iid) + encode_string_field(2, value),
+          )
+      )
+  return b"".join(parts)
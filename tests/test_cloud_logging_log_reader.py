@@ -0,0 +1,226 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Cloud Logging log reader, with a fake Cloud Logging client."""
+
+import datetime
+import re
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from google.cloud import logging_v2
+
+from mltrace import constants
+from mltrace.log_reader import cloud_logging_log_reader
+from mltrace.log_reader import log_cache
+
+
+def _make_entry(timestamp: datetime.datetime, i: int, valid: bool = True):
+  """Returns a fake log entry with the fields read by the reader."""
+  labels = {
+      "project_id": "p",
+      "cluster_name": "c",
+      "location": "us",
+      "container_name": "jax",
+      "pod_name": f"myjob-slice-job-0-{i % 2}-abcde",
+  }
+  if not valid:
+    del labels["pod_name"]
+  return types.SimpleNamespace(
+      insert_id=f"id{i}",
+      timestamp=timestamp,
+      text_payload=f"Step {i}",
+      json_payload=None,
+      severity=types.SimpleNamespace(name="INFO"),
+      source_location=types.SimpleNamespace(file="main.py", line=i),
+      labels={},
+      resource=types.SimpleNamespace(
+          ListFields=lambda: [(None, "k8s_container"), (None, labels)]
+      ),
+  )
+
+
+class FakeClient:
+  """Serves the entries within the time window of each request.
+
+  Attributes:
+    requests (list): Time window and page token of each request
+    fail_at_page (int): Index of the page that fails with an error, counted
+      over all requests. None to never fail.
+  """
+
+  def __init__(self, entries):
+    self._entries = entries
+    self.requests = []
+    self.fail_at_page = None
+    self._num_pages = 0
+
+  def list_log_entries(self, request):
+    start, end = (
+        datetime.datetime.fromisoformat(t)
+        for t in re.findall(r'timestamp[<>]="([^"]+)"', request.filter)
+    )
+    self.requests.append((start, end, request.page_token))
+    entries = [e for e in self._entries if start <= e.timestamp <= end]
+    first = int(request.page_token or 0)
+    return types.SimpleNamespace(
+        pages=self._iter_pages(entries, first, request.page_size)
+    )
+
+  def _iter_pages(self, entries, first, page_size):
+    if first == len(entries) == 0:
+      yield types.SimpleNamespace(entries=[], next_page_token="")
+    for i in range(first, len(entries), page_size):
+      if self._num_pages == self.fail_at_page:
+        raise RuntimeError("Quota exceeded")
+      self._num_pages += 1
+      next_page = i + page_size
+      yield types.SimpleNamespace(
+          entries=entries[i:next_page],
+          next_page_token=str(next_page) if next_page < len(entries) else "",
+      )
+
+
+def make_entries(
+    start: datetime.datetime, num_entries: int, valid=True, spacing_s=1
+):
+  return [
+      _make_entry(start + datetime.timedelta(seconds=i * spacing_s), i, valid)
+      for i in range(num_entries)
+  ]
+
+
+def to_time_str(t: datetime.datetime) -> str:
+  return t.strftime(constants.TIME_REGEXP)
+
+
+class CloudLoggingReaderTestCase(unittest.TestCase):
+  """Patches the Cloud Logging client with a `FakeClient`."""
+
+  def setUp(self):
+    super().setUp()
+    self._tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self._tmp_dir.cleanup)
+    self.client = FakeClient([])
+    patcher = mock.patch.object(
+        logging_v2.services.logging_service_v2,
+        "LoggingServiceV2Client",
+        return_value=self.client,
+    )
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def make_reader(self, start, end, **kwargs):
+    return cloud_logging_log_reader.CloudLoggingLogReader(
+        "p", "myjob", to_time_str(start), to_time_str(end), "", **kwargs
+    )
+
+
+class ReadLogsWithCacheTest(CloudLoggingReaderTestCase):
+
+  def test_reads_the_cached_window_once(self):
+    start = datetime.datetime(2025, 7, 22, 12, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(seconds=99)
+    self.client._entries = make_entries(start, 100)
+    uncached = self.make_reader(start, end).read_logs()
+    self.client.requests.clear()
+
+    cache_dir = self._tmp_dir.name
+    first = self.make_reader(start, end, cache_dir=cache_dir).read_logs()
+    self.assertEqual(len(self.client.requests), 1)
+    second = self.make_reader(start, end, cache_dir=cache_dir).read_logs()
+    self.assertEqual(len(self.client.requests), 1)
+    for logs in [first, second]:
+      self.assertEqual(
+          logs["insertId"].tolist(), uncached["insertId"].tolist()
+      )
+
+  def test_keeps_the_logs_too_recent_to_be_cached(self):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    start = now - log_cache.LATE_ARRIVAL_MARGIN * 2
+    self.client._entries = make_entries(start, 60, spacing_s=9)
+    end = self.client._entries[-1].timestamp
+    for _ in range(2):
+      logs = self.make_reader(
+          start, end, cache_dir=self._tmp_dir.name
+      ).read_logs()
+      self.assertEqual(len(logs), 60)
+    # Only the recent part of the window is fetched again.
+    self.assertEqual(len(self.client.requests), 2)
+    self.assertGreater(self.client.requests[-1][0], start)
+
+  def test_does_not_cache_logs_with_an_invalid_structure(self):
+    start = datetime.datetime(2025, 7, 22, 12, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(seconds=9)
+    self.client._entries = make_entries(start, 10, valid=False)
+    logs = self.make_reader(
+        start, end, cache_dir=self._tmp_dir.name
+    ).read_logs()
+    self.assertEqual(len(logs), 0)
+
+    self.client._entries = make_entries(start, 10)
+    logs = self.make_reader(
+        start, end, cache_dir=self._tmp_dir.name
+    ).read_logs()
+    self.assertEqual(len(logs), 10)
+
+
+
+class ResumeTest(CloudLoggingReaderTestCase):
+
+  def setUp(self):
+    super().setUp()
+    patcher = mock.patch.object(cloud_logging_log_reader, "PAGE_SIZE", 3)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.start = datetime.datetime(
+        2025, 7, 22, 12, tzinfo=datetime.timezone.utc
+    )
+    self.end = self.start + datetime.timedelta(seconds=9)
+    self.client._entries = make_entries(self.start, 10)
+
+  def test_resumes_after_the_last_completed_page(self):
+    self.client.fail_at_page = 2
+    with self.assertRaises(RuntimeError):
+      self.make_reader(
+          self.start, self.end, work_dir=self._tmp_dir.name
+      ).read_logs()
+
+    self.client.fail_at_page = None
+    self.client.requests.clear()
+    logs = self.make_reader(
+        self.start, self.end, work_dir=self._tmp_dir.name, resume=True
+    ).read_logs()
+    self.assertEqual(logs["insertId"].tolist(), [f"id{i}" for i in range(10)])
+    self.assertEqual([token for _, _, token in self.client.requests], ["6"])
+
+  def test_starts_over_without_resume(self):
+    self.client.fail_at_page = 2
+    with self.assertRaises(RuntimeError):
+      self.make_reader(
+          self.start, self.end, work_dir=self._tmp_dir.name
+      ).read_logs()
+
+    self.client.fail_at_page = None
+    self.client.requests.clear()
+    logs = self.make_reader(
+        self.start, self.end, work_dir=self._tmp_dir.name
+    ).read_logs()
+    self.assertEqual(len(logs), 10)
+    self.assertEqual([token for _, _, token in self.client.requests], [""])
+
+
+if __name__ == "__main__":
+  unittest.main()
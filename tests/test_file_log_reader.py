@@ -0,0 +1,85 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the file log reader."""
+
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from mltrace import log_parser
+from mltrace.log_reader import file_log_reader
+
+
+def make_log(i: int, json_payload: bool = False) -> dict:
+  """Returns a log of a McJAX worker as exported by Cloud Logging."""
+  log = {
+      "insertId": f"id{i}",
+      "timestamp": f"2025-07-22T12:00:{i % 60:02d}.000000123Z",
+      "severity": "INFO",
+      "resource": {
+          "type": "k8s_container",
+          "labels": {
+              "pod_name": f"myjob-slice-job-0-{i % 2}-abcde",
+              "container_name": "jax",
+          },
+      },
+      "sourceLocation": {"file": "main.py", "line": "3"},
+  }
+  if json_payload:
+    log["jsonPayload"] = {"message": f"Step {i}"}
+  else:
+    log["textPayload"] = f"Step {i}"
+  return log
+
+
+class ReadLogsInChunksTest(unittest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self._tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self._tmp_dir.cleanup)
+    self._filename = os.path.join(self._tmp_dir.name, "logs.jsonl")
+    # Only the last chunk has logs with a jsonPayload.
+    with open(self._filename, "w") as fp:
+      for i in range(10):
+        fp.write(json.dumps(make_log(i, json_payload=i >= 8)) + "\n")
+
+  def test_chunks_add_up_to_the_whole_file(self):
+    reader = file_log_reader.FileLogReader(self._filename)
+    chunks = list(reader.read_logs_in_chunks(4))
+    self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+    self.assertEqual(
+        pd.concat(chunks)["insertId"].tolist(),
+        reader.read_logs()["insertId"].tolist(),
+    )
+
+  def test_chunks_without_a_nested_column_are_parsed(self):
+    reader = file_log_reader.FileLogReader(self._filename)
+    parsed = [
+        log_parser.parse_logs(chunk, "myjob")
+        for chunk in reader.read_logs_in_chunks(4)
+    ]
+    first_chunk = next(reader.read_logs_in_chunks(4))
+    self.assertNotIn("jsonPayload", first_chunk.columns)
+    self.assertEqual(
+        pd.concat(parsed)["textPayload"].tolist(),
+        [f"Step {i}" for i in range(10)],
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
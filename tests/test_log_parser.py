@@ -0,0 +1,99 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the log parser."""
+
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from mltrace import log_parser
+from mltrace import matcher
+from mltrace import rules
+
+TEXTS = [
+    "Starting training.",
+    "Loaded shard 3 of 9",
+    "Waiting for the checkpoint (?=lookahead)",
+    "Step 10: loss 0.5",
+]
+RULE_SET = rules.RuleSet(
+    redundant_logs_exact=["Starting training."],
+    redundant_logs_substr_match=[r"Loaded shard \d+ of", r"checkpoint(?= \()"],
+    section_rules={"loss": "Losses", "checkpoint": "Checkpoint"},
+)
+
+
+def _make_logs(dtype) -> pd.DataFrame:
+  return pd.DataFrame({
+      "textPayload": pd.Series(TEXTS, dtype=dtype),
+      "sourceLocation.file": ["train.py"] * len(TEXTS),
+      "severity": ["INFO"] * len(TEXTS),
+  })
+
+
+class FilterOutUnnecessaryLogsTest(unittest.TestCase):
+
+  def test_engines_agree(self):
+    for dtype in [object, "string[pyarrow]"]:
+      for engine in ["python", "pyarrow"]:
+        with self.subTest(dtype=dtype, engine=engine):
+          logs = log_parser.filter_out_unnecessary_logs(
+              _make_logs(dtype), RULE_SET, engine
+          )
+          self.assertEqual(logs["textPayload"].tolist(), [TEXTS[3]])
+
+  def test_arrow_backed_texts_skip_the_python_matcher(self):
+    logs = _make_logs("string[pyarrow]")
+    self.assertTrue(matcher.is_arrow_backed(logs["textPayload"]))
+    with mock.patch.object(
+        matcher.PatternMatcher, "search", side_effect=AssertionError
+    ):
+      log_parser.filter_out_unnecessary_logs(
+          logs, rules.get_default_rule_set(), "python"
+      )
+
+  def test_object_texts_use_the_python_matcher(self):
+    logs = _make_logs(object)
+    self.assertFalse(matcher.is_arrow_backed(logs["textPayload"]))
+    with mock.patch.object(
+        matcher.ArrowPatternMatcher, "contains", side_effect=AssertionError
+    ):
+      log_parser.filter_out_unnecessary_logs(logs, RULE_SET, "python")
+
+
+
+class AddSectionTest(unittest.TestCase):
+
+  def test_engines_agree(self):
+    for dtype in [object, "string[pyarrow]"]:
+      for engine in ["python", "pyarrow"]:
+        with self.subTest(dtype=dtype, engine=engine):
+          logs = log_parser.add_section(_make_logs(dtype), RULE_SET, engine)
+          self.assertEqual(
+              logs["section"].tolist(),
+              ["train.py", "train.py", "Checkpoint", "Losses"],
+          )
+
+  def test_arrow_backed_texts_skip_the_python_classifier(self):
+    with mock.patch.object(
+        matcher.SectionClassifier, "classify", side_effect=AssertionError
+    ):
+      log_parser.add_section(
+          _make_logs("string[pyarrow]"), rules.get_default_rule_set(), "python"
+      )
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,137 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the stages that reduce the number of trace events."""
+
+import unittest
+
+import pandas as pd
+
+from mltrace import constants
+from mltrace import log_reducer
+
+
+def _make_logs(texts, timestamps, parents=None):
+  return pd.DataFrame({
+      "parent": parents or ["Coordinator"] * len(texts),
+      "section": ["Other logs"] * len(texts),
+      "textPayload": texts,
+      "timestamp": timestamps,
+  })
+
+
+class CollapseRepeatsTest(unittest.TestCase):
+
+  def test_collapses_runs(self):
+    logs = _make_logs(
+        ["a", "a", "a", "b"],
+        [f"2025-07-22T12:00:0{i}.000000Z" for i in range(4)],
+    )
+    collapsed = log_reducer.collapse_repeats(logs)
+    self.assertEqual(collapsed["textPayload"].tolist(), ["a", "b"])
+    self.assertEqual(collapsed["repeat_count"].iloc[0], 3)
+    self.assertTrue(pd.isna(collapsed["repeat_count"].iloc[1]))
+    self.assertEqual(
+        collapsed["last_timestamp"].iloc[0], "2025-07-22T12:00:02.000000Z"
+    )
+
+  def test_descending_input_ends_runs_at_their_latest_log(self):
+    logs = _make_logs(
+        ["b", "a", "a", "a"],
+        [f"2025-07-22T12:00:0{i}.000000Z" for i in reversed(range(4))],
+    )
+    collapsed = log_reducer.collapse_repeats(logs)
+    self.assertEqual(collapsed["textPayload"].tolist(), ["a", "b"])
+    self.assertEqual(
+        collapsed["timestamp"].iloc[0], "2025-07-22T12:00:00.000000Z"
+    )
+    self.assertEqual(
+        collapsed["last_timestamp"].iloc[0], "2025-07-22T12:00:02.000000Z"
+    )
+
+  def test_na_backed_strings(self):
+    logs = _make_logs(
+        ["a", "a", "b"],
+        [f"2025-07-22T12:00:0{i}.000000Z" for i in range(3)],
+    ).astype({"textPayload": "string"})
+    collapsed = log_reducer.collapse_repeats(logs)
+    self.assertEqual(collapsed["repeat_count"].iloc[0], 2)
+
+  def test_keeps_samples(self):
+    logs = _make_logs(
+        ["a"] * 5, [f"2025-07-22T12:00:0{i}.000000Z" for i in range(5)]
+    )
+    collapsed = log_reducer.collapse_repeats(logs, max_samples=3)
+    self.assertEqual(
+        collapsed["timestamp"].str[17:19].tolist(), ["00", "02", "04"]
+    )
+
+
+
+class FoldWorkersTest(unittest.TestCase):
+
+  def _make_worker_logs(self, workers, texts, milliseconds):
+    logs = _make_logs(
+        texts,
+        [f"2025-07-22T12:00:00.{ms:03d}000Z" for ms in milliseconds],
+        parents=[constants.WORKER_GROUP_PREFIX + w for w in workers],
+    )
+    return logs.assign(
+        parent=logs["parent"].astype("category"), worker_num=workers
+    )
+
+  def test_folds_logs_of_distinct_workers(self):
+    logs = self._make_worker_logs(
+        ["0-1", "0-0", "0-2", "0-1"], ["a"] * 4, [0, 5, 10, 15]
+    )
+    folded = log_reducer.fold_workers(logs, tolerance=0.1)
+    self.assertEqual(len(folded), 1)
+    self.assertEqual(folded["parent"].iloc[0], constants.ALL_WORKERS_GROUP)
+    self.assertEqual(folded["num_workers"].iloc[0], 3)
+    self.assertEqual(
+        folded["workers"].iloc[0],
+        "Slice-Worker 0-1, Slice-Worker 0-0, Slice-Worker 0-2",
+    )
+    self.assertEqual(folded["timestamp_spread_ms"].iloc[0], 15)
+    self.assertTrue(pd.isna(folded["worker_num"].iloc[0]))
+
+  def test_keeps_repeats_of_a_single_worker(self):
+    logs = self._make_worker_logs(["0-1"] * 3, ["a"] * 3, [0, 5, 10])
+    folded = log_reducer.fold_workers(logs, tolerance=0.1)
+    self.assertEqual(folded["parent"].tolist(), logs["parent"].tolist())
+    self.assertTrue(folded["num_workers"].isna().all())
+
+  def test_keeps_stragglers_outside_the_tolerance(self):
+    logs = self._make_worker_logs(
+        ["0-0", "0-1", "0-2"], ["a"] * 3, [0, 50, 900]
+    )
+    folded = log_reducer.fold_workers(logs, tolerance=0.1)
+    self.assertEqual(
+        folded["parent"].tolist(),
+        [constants.ALL_WORKERS_GROUP, constants.WORKER_GROUP_PREFIX + "0-2"],
+    )
+    self.assertEqual(folded["num_workers"].iloc[0], 2)
+
+  def test_does_not_fold_other_groups_or_texts(self):
+    logs = self._make_worker_logs(["0-0", "0-1"], ["a", "b"], [0, 1])
+    logs = pd.concat([
+        logs,
+        _make_logs(["a"], ["2025-07-22T12:00:00.002000Z"], ["Other"]),
+    ], ignore_index=True)
+    folded = log_reducer.fold_workers(logs, tolerance=0.1)
+    self.assertEqual(len(folded), 3)
+    self.assertTrue(folded["num_workers"].isna().all())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,62 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the entry point of mltrace."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from mltrace import main
+from mltrace import rules
+from mltrace.log_reader import file_log_reader
+from test_file_log_reader import make_log
+
+
+class ReadAndParseInParallelTest(unittest.TestCase):
+
+  def test_workers_apply_the_given_rules(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    filenames = []
+    for i in range(2):
+      filename = os.path.join(tmp_dir.name, f"logs{i}.jsonl")
+      with open(filename, "w") as fp:
+        for j in range(5 * i, 5 * i + 5):
+          fp.write(json.dumps(make_log(j)) + "\n")
+      filenames.append(filename)
+    rule_set = rules.RuleSet.from_dict({
+        "redundant_logs_exact": ["Step 3"],
+        "section_rules": {"Step 7": "Seventh step"},
+    })
+    readers = [file_log_reader.FileLogReader(f) for f in filenames]
+
+    num_logs, data = main.read_and_parse_in_parallel(
+        readers, "myjob", rule_set, "python", num_workers=2
+    )
+
+    self.assertEqual(num_logs, 10)
+    data = data.sort_values("timestamp")
+    self.assertEqual(
+        data["textPayload"].tolist(),
+        [f"Step {i}" for i in range(10) if i != 3],
+    )
+    self.assertEqual(
+        data.loc[data["textPayload"] == "Step 7", "section"].tolist(),
+        ["Seventh step"],
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
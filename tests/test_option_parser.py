@@ -0,0 +1,79 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the validation of the command-line arguments."""
+
+import sys
+import unittest
+from unittest import mock
+
+from mltrace import option_parser
+
+CLOUD_ARGS = [
+    "run_mltrace.py", "-p", "project", "-j", "myjob", "-o", "traces"
+]
+START = ["-s", "2025-07-22T12:00:00.000000+0000"]
+END = ["-e", "2025-07-22T13:00:00.000000+0000"]
+
+
+def getopts(*args):
+  with mock.patch.object(sys, "argv", CLOUD_ARGS + list(args)):
+    return option_parser.getopts()
+
+
+class GetoptsTest(unittest.TestCase):
+
+  def test_checkpoints_require_an_explicit_time_window(self):
+    for args in [
+        ["--work_dir", "wd"],
+        ["--work_dir", "wd", "--resume"],
+        ["--work_dir", "wd", "--resume", *START],
+        ["--work_dir", "wd", "--resume", *END],
+    ]:
+      with self.subTest(args=args):
+        with self.assertRaises(option_parser.IllegalArgumentError):
+          getopts(*args)
+    args = getopts("--work_dir", "wd", "--resume", *START, *END)
+    self.assertTrue(args.resume)
+
+  def test_async_fetch_rejects_the_options_it_ignores(self):
+    for args in [
+        ["--num_shards", "4"],
+        ["--cache_dir", "cache"],
+        ["--work_dir", "wd"],
+        ["--work_dir", "wd", "--resume"],
+    ]:
+      with self.subTest(args=args):
+        with self.assertRaises(option_parser.IllegalArgumentError):
+          getopts("--async_fetch", *START, *END, *args)
+    args = getopts("--async_fetch", *START, *END, "--chunksize", "1000")
+    self.assertTrue(args.async_fetch)
+
+  def test_follow_rejects_the_options_it_ignores(self):
+    for args in [
+        ["--async_fetch"],
+        ["--num_shards", "4"],
+        ["--cache_dir", "cache"],
+        ["--chunksize", "1000"],
+        ["--work_dir", "wd", *END],
+        ["--work_dir", "wd", "--resume", *END],
+    ]:
+      with self.subTest(args=args):
+        with self.assertRaises(option_parser.IllegalArgumentError):
+          getopts("--follow", *START, *args)
+    args = getopts("--follow", *START, "--flush_interval", "10")
+    self.assertTrue(args.follow)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,84 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the translation of the logs to Perfetto traces."""
+
+import datetime
+import unittest
+
+import pandas as pd
+
+from mltrace import perfetto_trace_utils
+
+
+class GetTimestampsUsTest(unittest.TestCase):
+
+  def test_truncates_strings(self):
+    timestamps = pd.Series(["2025-07-22T12:00:00.123456789Z"])
+    self.assertEqual(
+        perfetto_trace_utils.get_timestamps_us(timestamps).tolist(),
+        [1753185600123456],
+    )
+
+  def test_converts_datetimes(self):
+    timestamps = pd.Series([
+        datetime.datetime(
+            2025, 7, 22, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc
+        )
+    ])
+    self.assertEqual(
+        perfetto_trace_utils.get_timestamps_us(timestamps).tolist(),
+        [1753185600123456],
+    )
+
+
+class SortByTrackTest(unittest.TestCase):
+
+  def test_groups_tracks_in_order_of_first_log(self):
+    df = pd.DataFrame({
+        "parent": ["b", "a", "b", "a", "b"],
+        "section": ["x", "y", "z", "y", "x"],
+        "n": range(5),
+    })
+    sorted_df, bounds = perfetto_trace_utils.sort_by_track(df)
+    self.assertEqual(sorted_df["n"].tolist(), [0, 4, 2, 1, 3])
+    self.assertEqual(bounds.tolist(), [0, 2, 3, 5])
+
+
+class TraceBuilderTest(unittest.TestCase):
+
+  def test_translates_each_track_like_a_separate_call(self):
+    df = pd.DataFrame({
+        "parent": ["w1", "w2", "w1", "w2"],
+        "section": ["s"] * 4,
+        "textPayload": ["a", "b", "a", "c"],
+        "timestamp": [f"2025-07-22T12:00:0{i}.000000Z" for i in range(4)],
+        "insertId": ["i0", "i1", "i2", "i3"],
+    })
+    builder = perfetto_trace_utils.TraceBuilder()
+    builder.add_logs(df)
+    separately = perfetto_trace_utils.TraceBuilder()
+    separately.add_logs(df[df["parent"] == "w1"])
+    separately.add_logs(df[df["parent"] == "w2"])
+    self.assertEqual(builder.flush(), separately.flush())
+
+  def test_empty_logs(self):
+    builder = perfetto_trace_utils.TraceBuilder()
+    builder.add_logs(pd.DataFrame(columns=["parent", "section"]))
+    self.assertEqual(
+        builder.flush(), perfetto_trace_utils.TraceBuilder().flush()
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
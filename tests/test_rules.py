@@ -0,0 +1,41 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the rule sets."""
+
+import unittest
+
+from mltrace import rules
+
+
+class BuildCloudLoggingFilterTest(unittest.TestCase):
+
+  def test_exact_texts_are_compared_as_strings(self):
+    rule_set = rules.RuleSet(
+        redundant_logs_exact=['Loaded 3 files (*.json) from "a\\b"']
+    )
+    self.assertEqual(
+        rule_set.build_cloud_logging_filter(),
+        'textPayload!="Loaded 3 files (*.json) from \\"a\\\\b\\"" ',
+    )
+
+  def test_substr_match_patterns_are_regexes(self):
+    rule_set = rules.RuleSet(redundant_logs_substr_match=["Loaded \\d+"])
+    self.assertEqual(
+        rule_set.build_cloud_logging_filter(),
+        'textPayload!~"Loaded \\\\d+" ',
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
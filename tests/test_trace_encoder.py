@@ -0,0 +1,115 @@
+# Copyright 2023 Google LLC
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#      https://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests that the direct encoder writes the same bytes as protobuf."""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from perfetto.protos.perfetto.trace import perfetto_trace_pb2
+
+from mltrace import perfetto_trace_utils
+from mltrace import trace_encoder
+
+
+def _make_logs(offset: int = 0) -> pd.DataFrame:
+  """Returns logs on several tracks, with collapsed runs and null values."""
+  return pd.DataFrame({
+      "parent": pd.Categorical(
+          ["Coordinator", "Slice-Worker 0-1", "Coordinator", "All workers"] * 3
+      ),
+      "section": pd.Categorical(["Other logs", "Checkpoint"] * 6),
+      "textPayload": [
+          "Starting training.",
+          "Saved checkpoint 1 — ünïcode",
+          "Starting training.",
+          "Step 1",
+      ] * 3,
+      "timestamp": [
+          f"2025-07-22T12:00:{offset + i:02d}.123456789Z" for i in range(12)
+      ],
+      "insertId": [f"id{offset + i}" for i in range(12)],
+      "severity": pd.Categorical(["INFO", "WARNING", None, "INFO"] * 3),
+      "repeat_count": pd.array([None, 3, None, None] * 3, dtype="Int64"),
+      "last_timestamp": [
+          None, f"2025-07-22T12:01:{offset:02d}.000000Z", None, None
+      ] * 3,
+  })
+
+
+def _build(builder_class, intern_strings, batches) -> bytes:
+  builder = builder_class(intern_strings)
+  traces = b""
+  for logs in batches:
+    builder.add_logs(logs)
+    traces += builder.flush()
+  return traces
+
+
+class EncodeVarintTest(unittest.TestCase):
+
+  def test_matches_protobuf(self):
+    for value in [0, 1, 127, 128, 300, 2**32, 2**63 - 1, -1]:
+      with self.subTest(value=value):
+        event = perfetto_trace_pb2.TrackEvent(timestamp_absolute_us=value)
+        self.assertEqual(
+            trace_encoder.encode_varint_field(16, value),
+            event.SerializeToString(),
+        )
+
+
+class EncodedTraceBuilderTest(unittest.TestCase):
+
+  def test_matches_trace_builder(self):
+    batches = [_make_logs(0), _make_logs(20)]
+    for intern_strings in [True, False]:
+      with self.subTest(intern_strings=intern_strings):
+        expected = _build(
+            perfetto_trace_utils.TraceBuilder, intern_strings, batches
+        )
+        actual = _build(
+            perfetto_trace_utils.EncodedTraceBuilder, intern_strings, batches
+        )
+        self.assertEqual(actual, expected)
+        trace = perfetto_trace_pb2.Trace.FromString(actual)
+        self.assertTrue(
+            any(p.HasField("track_descriptor") for p in trace.packet)
+        )
+        self.assertTrue(
+            any(
+                p.track_event.type == p.track_event.TYPE_SLICE_END
+                for p in trace.packet
+            )
+        )
+
+  def test_matches_trace_builder_with_writer(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      traces = []
+      for fast_encoder in [False, True]:
+        input_filepath = os.path.join(tmp_dir, f"logs{fast_encoder}.jsonl")
+        with perfetto_trace_utils.TraceWriter(input_filepath) as writer:
+          builder = perfetto_trace_utils.get_trace_builder(
+              writer=writer, fast_encoder=fast_encoder
+          )
+          builder.add_logs(_make_logs())
+          builder.flush()
+        with gzip.open(writer.filepath, "rb") as fp:
+          traces.append(fp.read())
+      self.assertEqual(traces[1], traces[0])
+
+
+if __name__ == "__main__":
+  unittest.main()